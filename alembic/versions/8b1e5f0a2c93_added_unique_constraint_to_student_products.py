@@ -0,0 +1,31 @@
+"""Added unique constraint to student_products
+
+Revision ID: 8b1e5f0a2c93
+Revises: 485a84572e13
+Create Date: 2026-10-19 11:02:17.418305
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8b1e5f0a2c93"
+down_revision = "485a84572e13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Повторные покупки, проскочившие гонку до появления ограничения: оставляем первую по id.
+    # Баланс не трогаем - расхождение попадёт в журнал баллов корректировкой (c8f4a2d61b07)
+    op.execute(
+        "DELETE FROM student_products USING student_products AS first "
+        "WHERE first.student_id = student_products.student_id "
+        "AND first.product_id = student_products.product_id "
+        "AND first.id < student_products.id"
+    )
+    op.create_unique_constraint("uq_student_product", "student_products", ["student_id", "product_id"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_student_product", "student_products", type_="unique")
@@ -0,0 +1,35 @@
+"""Added table 'achievement_counters'
+
+Revision ID: a7c5e2f19d34
+Revises: f3b26e8d4a71
+Create Date: 2026-10-19 15:02:44.381920
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a7c5e2f19d34"
+down_revision = "f3b26e8d4a71"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "achievement_counters",
+        sa.Column("achievement_id", sa.Integer(), nullable=False),
+        sa.Column("receive_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["achievement_id"], ["achievements.id"]),
+        sa.PrimaryKeyConstraint("achievement_id"),
+    )
+    op.execute(
+        "INSERT INTO achievement_counters (achievement_id, receive_count) "
+        "SELECT achievement_id, count(*) FROM student_achievements GROUP BY achievement_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("achievement_counters")
@@ -0,0 +1,60 @@
+"""Added analytics rollup tables
+
+Revision ID: b5e81c3d9f42
+Revises: a7c5e2f19d34
+Create Date: 2026-10-19 16:41:08.512734
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b5e81c3d9f42"
+down_revision = "a7c5e2f19d34"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "achievement_rollups",
+        sa.Column("achievement_type", sa.String(), nullable=False),
+        sa.Column("profession", sa.String(), nullable=False),
+        sa.Column("cohort", sa.Date(), nullable=False),
+        sa.Column("receive_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("achievement_type", "profession", "cohort"),
+    )
+    op.create_table(
+        "challenge_rollups",
+        sa.Column("challenge_id", sa.String(), nullable=False),
+        sa.Column("profession", sa.String(), nullable=False),
+        sa.Column("cohort", sa.Date(), nullable=False),
+        sa.Column("completed_count", sa.Integer(), nullable=False),
+        sa.Column("points_earned", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("challenge_id", "profession", "cohort"),
+    )
+    op.execute(
+        "INSERT INTO achievement_rollups (achievement_type, profession, cohort, receive_count) "
+        "SELECT achievements.type::text, students.profession::text, date_trunc('month', students.started_at)::date, "
+        "count(*) "
+        "FROM student_achievements "
+        "JOIN students ON students.id = student_achievements.student_id "
+        "JOIN achievements ON achievements.id = student_achievements.achievement_id "
+        "GROUP BY 1, 2, 3"
+    )
+    op.execute(
+        "INSERT INTO challenge_rollups (challenge_id, profession, cohort, completed_count, points_earned) "
+        "SELECT student_challenges.challenge_id, students.profession::text, "
+        "date_trunc('month', students.started_at)::date, count(*), sum(challenges.value) "
+        "FROM student_challenges "
+        "JOIN students ON students.id = student_challenges.student_id "
+        "JOIN challenges ON challenges.id = student_challenges.challenge_id "
+        "GROUP BY 1, 2, 3"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("challenge_rollups")
+    op.drop_table("achievement_rollups")
@@ -0,0 +1,36 @@
+"""Added table 'idempotency_keys'
+
+Revision ID: c4d7a19e3b60
+Revises: 8b1e5f0a2c93
+Create Date: 2026-10-19 14:05:31.207614
+
+"""
+
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c4d7a19e3b60"
+down_revision = "8b1e5f0a2c93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sqlmodel.AutoString(), nullable=False),
+        sa.Column("request_hash", sqlmodel.AutoString(), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("response", sqlmodel.AutoString(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(op.f("ix_idempotency_keys_created_at"), "idempotency_keys", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_idempotency_keys_created_at"), table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,61 @@
+"""Added table 'points_ledger'
+
+Revision ID: c8f4a2d61b07
+Revises: b5e81c3d9f42
+Create Date: 2026-10-19 17:26:51.904318
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c8f4a2d61b07"
+down_revision = "b5e81c3d9f42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "points_ledger",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("student_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("challenge_id", sa.String(), nullable=True),
+        sa.Column("product_id", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.localtimestamp(), nullable=True),
+        sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"]),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"]),
+        sa.ForeignKeyConstraint(["student_id"], ["students.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_points_ledger_student_id"), "points_ledger", ["student_id"], unique=False)
+
+    # Начальные записи из истории челленджей и покупок
+    op.execute(
+        "INSERT INTO points_ledger (student_id, amount, kind, challenge_id) "
+        "SELECT student_challenges.student_id, challenges.value, 'earn', challenges.id "
+        "FROM student_challenges JOIN challenges ON challenges.id = student_challenges.challenge_id"
+    )
+    op.execute(
+        "INSERT INTO points_ledger (student_id, amount, kind, product_id, created_at) "
+        "SELECT student_products.student_id, -products.value, 'spend', products.id, student_products.created_at "
+        "FROM student_products JOIN products ON products.id = student_products.product_id"
+    )
+    # Баланс мог меняться вручную или вслед за стоимостью челленджа: разницу фиксируем корректировкой
+    op.execute(
+        "INSERT INTO points_ledger (student_id, amount, kind) "
+        "SELECT students.id, students.points - COALESCE(ledger.balance, 0), 'adjust' "
+        "FROM students LEFT JOIN ("
+        "SELECT student_id, sum(amount) AS balance FROM points_ledger GROUP BY student_id"
+        ") AS ledger ON ledger.student_id = students.id "
+        "WHERE students.points <> COALESCE(ledger.balance, 0)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_points_ledger_student_id"), table_name="points_ledger")
+    op.drop_table("points_ledger")
@@ -0,0 +1,45 @@
+"""Migrated student statistics and meme_stats to JSONB
+
+Revision ID: d2f83b6c5e17
+Revises: c4d7a19e3b60
+Create Date: 2026-10-19 14:10:52.630184
+
+"""
+
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d2f83b6c5e17"
+down_revision = "c4d7a19e3b60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for column in ("statistics", "meme_stats"):
+        op.alter_column(
+            "students",
+            column,
+            type_=postgresql.JSONB(),
+            existing_type=sqlmodel.AutoString(),
+            existing_nullable=False,
+            postgresql_using=f"{column}::jsonb",
+            server_default=sa.text("'{}'::jsonb"),
+        )
+
+
+def downgrade() -> None:
+    for column in ("statistics", "meme_stats"):
+        op.alter_column(
+            "students",
+            column,
+            type_=sqlmodel.AutoString(),
+            existing_type=postgresql.JSONB(),
+            existing_nullable=False,
+            postgresql_using=f"{column}::text",
+            server_default=None,
+        )
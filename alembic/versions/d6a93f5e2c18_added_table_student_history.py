@@ -0,0 +1,62 @@
+"""Added table 'student_history'
+
+Revision ID: d6a93f5e2c18
+Revises: c8f4a2d61b07
+Create Date: 2026-10-19 18:12:37.240615
+
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d6a93f5e2c18"
+down_revision = "c8f4a2d61b07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "student_history",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("student_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.localtimestamp(), nullable=True),
+        sa.Column("stats_delta", postgresql.JSONB(), nullable=True),
+        sa.Column("achievement_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["achievement_id"], ["achievements.id"]),
+        sa.ForeignKeyConstraint(["student_id"], ["students.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_student_history_student_id_created_at",
+        "student_history",
+        ["student_id", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_student_history_achievements",
+        "student_history",
+        ["student_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        unique=False,
+        postgresql_where=sa.text("achievement_id IS NOT NULL"),
+    )
+
+    # Раньше повторное получение достижения перезаписывало created_at, поэтому последняя дата - текущее достижение
+    op.execute(
+        "INSERT INTO student_history (student_id, achievement_id, created_at) "
+        "SELECT student_id, achievement_id, created_at FROM student_achievements"
+    )
+    # Прежние значения статистики не сохранялись: история начинается с текущего снимка
+    op.execute(
+        "INSERT INTO student_history (student_id, stats_delta) "
+        "SELECT id, statistics FROM students WHERE statistics <> '{}'::jsonb"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_student_history_achievements", table_name="student_history")
+    op.drop_index("ix_student_history_student_id_created_at", table_name="student_history")
+    op.drop_table("student_history")
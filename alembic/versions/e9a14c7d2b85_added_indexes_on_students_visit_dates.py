@@ -0,0 +1,37 @@
+"""Added indexes on students last_login and bonuses_last_visited
+
+Revision ID: e9a14c7d2b85
+Revises: d2f83b6c5e17
+Create Date: 2026-10-19 14:24:08.913527
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e9a14c7d2b85"
+down_revision = "d2f83b6c5e17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for column in ("last_login", "bonuses_last_visited"):
+            op.create_index(
+                op.f(f"ix_students_{column}"),
+                "students",
+                [column],
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for column in ("last_login", "bonuses_last_visited"):
+            op.drop_index(
+                op.f(f"ix_students_{column}"), table_name="students", postgresql_concurrently=True, if_exists=True
+            )
@@ -0,0 +1,42 @@
+"""Added updated_at to students
+
+Revision ID: f3b26e8d4a71
+Revises: e9a14c7d2b85
+Create Date: 2026-10-19 14:41:37.052816
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b26e8d4a71"
+down_revision = "e9a14c7d2b85"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # LOCALTIMESTAMP стабильна в пределах транзакции, поэтому колонка добавляется без перезаписи таблицы
+    op.add_column(
+        "students",
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.localtimestamp(), nullable=True),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_students_updated_at"),
+            "students",
+            ["updated_at"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_students_updated_at"), table_name="students", postgresql_concurrently=True, if_exists=True
+        )
+    op.drop_column("students", "updated_at")
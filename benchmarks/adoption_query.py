@@ -0,0 +1,89 @@
+"""Отчёт adoption: прежний запрос с размножением строк против предагрегированных счётчиков.
+
+Запуск из корня репозитория: python -m benchmarks.adoption_query
+Данные создаются в отдельной схеме внутри транзакции, которая откатывается после замеров.
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import Select, func, text
+from sqlmodel import not_, select
+
+from src.db.models import StudentChallenge, StudentDB, StudentProduct
+from src.db.session import async_session_maker
+from src.services.purchases import get_adoption_query
+
+# Распределения с длинным хвостом: большинство студентов выполнили несколько челленджей и почти ничего не купили.
+# students.id * 0 делает generate_series зависимым от строки, иначе random() вычисляется один раз на весь запрос
+SEED_SQL = """
+    CREATE SCHEMA adoption_benchmark;
+    SET LOCAL search_path TO adoption_benchmark;
+    CREATE TABLE students (id integer PRIMARY KEY, bonuses_last_visited timestamp, updated_at timestamp);
+    CREATE TABLE student_challenges (
+        id serial PRIMARY KEY, student_id integer, challenge_id varchar, UNIQUE (student_id, challenge_id)
+    );
+    CREATE TABLE student_products (
+        id serial PRIMARY KEY, student_id integer, product_id varchar, UNIQUE (student_id, product_id)
+    );
+    INSERT INTO students
+    SELECT i, CASE WHEN random() < 0.6 THEN LOCALTIMESTAMP - random() * interval '90 days' END, LOCALTIMESTAMP
+    FROM generate_series(1, :students) AS i;
+    INSERT INTO student_challenges (student_id, challenge_id)
+    SELECT students.id, 'challenge_' || n
+    FROM students, LATERAL generate_series(1, floor(40 * random() ^ 2 + students.id * 0)::int) AS n;
+    INSERT INTO student_products (student_id, product_id)
+    SELECT students.id, 'product_' || n
+    FROM students, LATERAL generate_series(1, floor(12 * random() ^ 3 + students.id * 0)::int) AS n;
+    ANALYZE students, student_challenges, student_products
+"""
+
+
+def get_fan_out_adoption_query() -> Select:
+    """Прежний запрос: каждый студент размножается на челленджи x покупки"""
+    return (
+        select(
+            StudentDB.id,
+            StudentDB.bonuses_last_visited,
+            func.count(func.distinct(StudentChallenge.challenge_id)).label("completed_challenges"),
+            func.count(func.distinct(StudentProduct.product_id)).label("purchased_products"),
+        )
+        .outerjoin(StudentChallenge)
+        .outerjoin(StudentProduct)
+        .where(not_(StudentDB.bonuses_last_visited.is_(None)))
+        .group_by(StudentDB.id, StudentDB.bonuses_last_visited, StudentDB.updated_at)
+        .order_by(StudentDB.updated_at, StudentDB.id)
+    )
+
+
+async def main(students_counts: list[int], repeat: int) -> None:
+    queries = {"fan-out": get_fan_out_adoption_query(), "pre-aggregated": get_adoption_query()}
+
+    for students_count in students_counts:
+        async with async_session_maker() as session:
+            for statement in SEED_SQL.split(";"):
+                await session.execute(text(statement), {"students": students_count})
+
+            timings = {}
+            for name, query in queries.items():
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    rows = (await session.execute(query)).all()
+                timings[name] = (time.perf_counter() - started) / repeat
+
+            await session.rollback()
+
+        print(  # noqa: T201
+            f"{students_count} students, {len(rows)} in report: "
+            + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк запроса отчёта adoption на синтетических данных")
+    parser.add_argument("--students", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.students, args.repeat))
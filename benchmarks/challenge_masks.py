@@ -0,0 +1,55 @@
+"""Проверка условий челленджей: построчный eval против масок NumPy по чанку студентов.
+
+Запуск из корня репозитория: python -m benchmarks.challenge_masks
+"""
+
+import argparse
+import random
+import timeit
+
+from src.models import ProfessionEnum
+from src.services.challenges_scoring import CompiledChallenge, evaluate_chunk
+from src.services.condition_masks import compile_mask
+from src.services.safe_eval import compile_condition, run_condition
+
+CONDITIONS = [
+    "homework_completed >= 10",
+    "lessons_completed > 20 and homework_completed >= 5",
+    "1 <= achievements < 5",
+    "lessons_completed - homework_completed * 2 > 3 or not achievements",
+]
+
+
+def row_wise(rows: list, challenges: list[CompiledChallenge]) -> list[dict]:
+    completions = []
+    for student_id, _, stats in rows:
+        for challenge in challenges:
+            try:
+                if run_condition(challenge.code, stats):
+                    completions.append({"student_id": student_id, "challenge_id": challenge.id})
+            except ValueError:
+                continue
+    return completions
+
+
+def main(students: int) -> None:
+    keys = ("homework_completed", "lessons_completed", "achievements")
+    rows = [
+        (student_id, random.choice(list(ProfessionEnum)), {key: random.randint(0, 40) for key in keys})
+        for student_id in range(students)
+    ]
+    challenges = [
+        CompiledChallenge(f"c{i}", "ALL", 10, compile_condition(condition), compile_mask(condition))
+        for i, condition in enumerate(CONDITIONS)
+    ]
+
+    for name, func in (("row-wise", row_wise), ("numpy", evaluate_chunk)):
+        args = (rows, challenges) if func is row_wise else (rows, challenges, set())
+        seconds = min(timeit.repeat(lambda func=func, args=args: func(*args), number=1, repeat=5))
+        print(f"{name}: {students / seconds:.0f} students/s ({len(challenges)} challenges)")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк проверки условий челленджей")
+    parser.add_argument("--students", type=int, default=10_000, help="студентов в чанке")
+    main(parser.parse_args().students)
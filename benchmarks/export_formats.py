@@ -0,0 +1,62 @@
+"""Потоковая генерация выгрузки покупок в каждом формате: размер, время и пиковая память.
+
+Запуск из корня репозитория: python -m benchmarks.export_formats --trace-memory
+С --max-peak-mib завершается с кодом 1, если пиковая память какого-то формата выше порога.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from src.db.session import EXPORT_CHUNK_SIZE
+from src.services.export_csv import EXPORT_GENERATORS
+
+
+async def synthetic_partitions(rows_count: int) -> AsyncIterator[list[tuple]]:
+    """Покупки пачками по EXPORT_CHUNK_SIZE, как их отдаёт курсор с yield_per"""
+    created_at = datetime(2024, 1, 1)
+    for offset in range(0, rows_count, EXPORT_CHUNK_SIZE):
+        yield [
+            (student_id, f"product_{student_id % 25}", created_at + timedelta(seconds=student_id), "admin")
+            for student_id in range(offset, min(offset + EXPORT_CHUNK_SIZE, rows_count))
+        ]
+
+
+async def main(rows_count: int, trace_memory: bool, max_peak_mib: float | None) -> bool:
+    """True, если пиковая память всех форматов не выше max_peak_mib"""
+    within_limit = True
+    for export_format, generate in EXPORT_GENERATORS.items():
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        size = 0
+        async for chunk in generate(synthetic_partitions(rows_count), "purchases"):
+            size += len(chunk)
+        seconds = time.perf_counter() - started
+
+        peak = ""
+        if trace_memory:
+            peak_mib = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            peak = f", peak memory {peak_mib:.2f} MiB"
+            if max_peak_mib is not None and peak_mib > max_peak_mib:
+                within_limit = False
+                peak += f" > {max_peak_mib} MiB"
+
+        print(f"{export_format.value:>8}: {rows_count} rows, {size / 2**20:.2f} MiB in {seconds:.2f} s{peak}")  # noqa: T201
+    return within_limit
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк потоковой генерации выгрузок")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--trace-memory", action="store_true", help="Замерить пиковую память (замедляет генерацию)")
+    parser.add_argument("--max-peak-mib", type=float, help="Порог пиковой памяти, включает --trace-memory")
+    args = parser.parse_args()
+
+    trace_memory = args.trace_memory or args.max_peak_mib is not None
+    sys.exit(0 if asyncio.run(main(args.rows, trace_memory, args.max_peak_mib)) else 1)
@@ -0,0 +1,46 @@
+"""Сериализация statistics: json (text) против orjson (кодек jsonb в движке).
+
+Запуск из корня репозитория: python -m benchmarks.json_codecs
+"""
+
+import argparse
+import json
+import random
+import timeit
+
+from src.db.json_codecs import json_deserializer, json_serializer
+
+
+def make_statistics(seed: int) -> dict:
+    """Статистика студента примерно того же размера и состава, что приходит из API"""
+    rng = random.Random(seed)
+    stats = {f"metric_{i}": rng.randint(0, 10_000) for i in range(40)}
+    stats.update(
+        program=rng.choice(["Python-разработчик", "Аналитик данных", "Графический дизайнер"]),
+        homework_total=rng.randint(0, 200),
+        lessons_completed=rng.randint(0, 300),
+    )
+    return stats
+
+
+def main(rows_count: int) -> None:
+    rows = [make_statistics(seed) for seed in range(rows_count)]
+
+    def stdlib_round_trip():
+        for row in rows:
+            json.loads(json.dumps(row, ensure_ascii=False))
+
+    def orjson_round_trip():
+        for row in rows:
+            json_deserializer(json_serializer(row))
+
+    for name, func in (("json", stdlib_round_trip), ("orjson", orjson_round_trip)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>6}: {seconds * 1000:.1f} ms per {rows_count} rows ({seconds / rows_count * 1e6:.2f} us/row)")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации statistics: json (text) против orjson (jsonb)")
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+    main(args.rows)
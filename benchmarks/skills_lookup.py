@@ -0,0 +1,52 @@
+"""Поиск навыков: линейный обход словаря против bisect по всем программам.
+
+Запуск из корня репозитория: python -m benchmarks.skills_lookup
+"""
+
+import argparse
+import random
+import timeit
+
+from src.classes.data_cache import DataCache
+
+
+def build_sheet(programs: int, levels_per_program: int, max_lessons: int) -> list[list[str]]:
+    sheet = [["program", "", "", "", "lessons_completed", "skill", "skill_extended"]]
+    for program in range(1, programs + 1):
+        for lessons in sorted(random.sample(range(1, max_lessons), levels_per_program)):
+            sheet.append([str(program), "", "", "", str(lessons), f"skill {lessons}", f"extended {lessons}"])
+    return sheet
+
+
+def main(programs: int, levels_per_program: int, max_lessons: int) -> None:
+    cache = DataCache()
+    cache.update_skills_details(build_sheet(programs, levels_per_program, max_lessons))
+    snapshot = cache.snapshot
+    queries = [(program, random.randint(0, max_lessons)) for program in range(1, programs + 1) for _ in range(100)]
+
+    def linear():
+        for program, lessons_completed in queries:
+            program_skills = snapshot.skills_details.get(program, {})
+            skills = []
+            for lessons_to_complete in program_skills:
+                if lessons_completed >= lessons_to_complete:
+                    skills.append(program_skills[lessons_to_complete])
+                else:
+                    break
+
+    def indexed():
+        for program, lessons_completed in queries:
+            snapshot.get_skills(program, lessons_completed)
+
+    for name, func in (("linear", linear), ("bisect", indexed)):
+        seconds = min(timeit.repeat(func, number=10, repeat=5)) / 10
+        print(f"{name}: {seconds / len(queries) * 1e6:.2f} us per lookup ({programs} programs)")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска навыков в DataCache")
+    parser.add_argument("--programs", type=int, default=60)
+    parser.add_argument("--levels", type=int, default=40, help="уровней навыков на программу")
+    parser.add_argument("--max-lessons", type=int, default=400)
+    args = parser.parse_args()
+    main(args.programs, args.levels, args.max_lessons)
@@ -10,7 +10,7 @@ from src.api.routes import api_router, open_api_router
 from src.bot.client import bot
 from src.config import settings, setup_middlewares
 from src.dependencies import data_cache, load_cache, mock_data_loader
-from src.services.background_tasks import update_meme_data_periodically
+from src.services.background_tasks import process_challenges_queue, refresh_sheets_periodically
 from src.web.badges import router as badges_router
 
 # from src.web.bonuses import router as bonuses_router
@@ -24,16 +24,24 @@ async def _lifespan(app: FastAPI):
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Bot has been started.")
 
-    # Start periodic task for updating memes
-    update_memes_task = asyncio.create_task(update_meme_data_periodically(mock_data_loader, data_cache))
+    # Start periodic task for updating data from Google Sheets
+    refresh_sheets_task = asyncio.create_task(refresh_sheets_periodically(mock_data_loader, data_cache))
+
+    # Start worker for updating challenges of students with changed statistics
+    challenges_task = asyncio.create_task(process_challenges_queue())
 
     yield
 
-    update_memes_task.cancel()
+    refresh_sheets_task.cancel()
+    challenges_task.cancel()
+    try:
+        await refresh_sheets_task
+    except asyncio.CancelledError:
+        logger.info("Background task for updating sheets data was cancelled")
     try:
-        await update_memes_task
+        await challenges_task
     except asyncio.CancelledError:
-        logger.info("Background task for updating memes was cancelled")
+        logger.info("Background task for updating challenges was cancelled")
 
     await bot.session.close()
     logger.info("Bot has been stopped.")
@@ -0,0 +1,18 @@
+"""Пересчёт выполненных челленджей для всех студентов.
+
+Запуск из корня репозитория: python -m scripts.score_challenges [--challenge ID] [--chunk-size N] [--dry-run]
+"""
+
+import argparse
+import asyncio
+
+from src.services.challenges_scoring import score_all_students
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт выполненных челленджей для всех студентов")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--challenge", action="append", dest="challenge_ids", help="ID челленджа (можно несколько)")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать, без записи в БД (бенчмарк)")
+    args = parser.parse_args()
+
+    asyncio.run(score_all_students(chunk_size=args.chunk_size, challenge_ids=args.challenge_ids, dry_run=args.dry_run))
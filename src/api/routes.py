@@ -1,18 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+from datetime import date
+from typing import Callable
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Security, status
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
+from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.classes.badges_cache import badges_cache
+from src.classes.data_cache import SHEET_UPDATERS
 from src.config import settings
+from src.db.analytics_crud import AnalyticsDBHandler, get_analytics_crud
 from src.db.badges_crud import BadgeDBHandler, get_badges_crud
 from src.db.challenges_crud import ChallengeDBHandler, get_challenge_crud
 from src.db.products_crud import ProductDBHandler, get_product_crud
 from src.db.session import get_async_session
-from src.db.students_crud import StudentDBHandler, get_student_crud
-from src.models import Badge, Challenge, DateQuery, Product, Purchase
-from src.services.export_csv import generate_csv
-from src.services.images import find_or_generate_image
-from src.services.purchases import get_purchased_products_and_challenges, process_purchase
+from src.db.students_crud import StudentDBHandler
+from src.dependencies import data_cache, mock_data_loader
+from src.models import Challenge, DateQuery, ExportFormat, Product, ProfessionEnumWithAll, Purchase
+from src.services.background_tasks import reload_jobs, start_reload_job
+from src.services.badge_cards import render_jobs, start_render_job
+from src.services.badges_ingest import BadgeBodyError, iter_badges
+from src.services.export_csv import EXPORT_MEDIA_TYPES, get_export_window, stream_export
+from src.services.idempotency import get_request_hash, run_idempotent
+from src.services.images import get_badge_card
+from src.services.purchases import (
+    MAX_BULK_PURCHASES,
+    iter_purchased_products_and_challenges,
+    purchase_product,
+    purchase_products,
+)
 
 api_key_header = APIKeyHeader(name="X-API-Key")
 
@@ -87,46 +104,120 @@ async def process_products(
     "/bonuses/purchases",
     name="purchases",
     summary="Добавить новую покупку",
-    description="Создаёт новую запись о покупке и возвращает результаты",
+    description="Создаёт новую запись о покупке и возвращает результаты. Повторный запрос с тем же заголовком "
+    "Idempotency-Key возвращает первоначальный ответ, не изменяя баланс",
 )
 async def process_purchases(
     data: Purchase,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     session: AsyncSession = Depends(get_async_session),
 ):
-    try:
-        purchase = await process_purchase(session, data)
+    async def get_response() -> JSONResponse:
+        # Отказ откатывает только покупку, ответ с ошибкой сохраняется по ключу так же, как успешный
+        try:
+            async with session.begin_nested():
+                purchase = await purchase_product(session, data)
+        except HTTPException as e:
+            return JSONResponse(content=e.detail, status_code=e.status_code)
         return JSONResponse(
             {"id": purchase.id, "created_at": purchase.created_at.isoformat()},
             status_code=status.HTTP_201_CREATED,
         )
-    except HTTPException as e:
-        return JSONResponse(content=e.detail, status_code=e.status_code)
+
+    try:
+        request_hash = get_request_hash(data.model_dump(exclude={"created_at"}))
+        return await run_idempotent(session, idempotency_key, request_hash, get_response)
+    except Exception as e:
+        return JSONResponse(
+            content={"status": "error", "message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_router.post(
+    "/bonuses/purchases/bulk",
+    name="purchases_bulk",
+    summary="Добавить несколько покупок",
+    description="Обрабатывает список покупок в одной транзакции и возвращает результат по каждой покупке. "
+    "Ошибка в одной покупке не отменяет остальные. Поддерживает заголовок Idempotency-Key",
+)
+async def process_purchases_bulk(
+    data: list[Purchase],
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    if len(data) > MAX_BULK_PURCHASES:
+        return JSONResponse(
+            content={"status": "error", "message": f"Максимум {MAX_BULK_PURCHASES} покупок за один запрос"},
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    async def get_response() -> JSONResponse:
+        results = await purchase_products(session, data)
+        created = sum(result["status_code"] == status.HTTP_201_CREATED for result in results)
+        return JSONResponse(
+            {"status": "OK", "created": created, "failed": len(results) - created, "results": results},
+            status_code=status.HTTP_200_OK,
+        )
+
+    try:
+        request_hash = get_request_hash([item.model_dump(exclude={"created_at"}) for item in data])
+        return await run_idempotent(session, idempotency_key, request_hash, get_response)
     except Exception as e:
         return JSONResponse(
             content={"status": "error", "message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+EXPORT_FORMAT_DESCRIPTION = "Формат файла: csv, csv.gz (CSV в gzip) или parquet (zstd)"
+
+
+EXPORT_CURSOR_DESCRIPTION = (
+    "Курсор из заголовка X-Export-Cursor предыдущей выгрузки. Если указан, выгружаются только строки, "
+    "добавленные или изменённые после неё"
+)
+
+
+def get_export_response(
+    type_: str, get_partitions: Callable, filename: str, export_format: ExportFormat, cursor: str | None = None
+) -> StreamingResponse:
+    media_type = EXPORT_MEDIA_TYPES[export_format]
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}.{export_format.value}",
+        "Content-Type": media_type,
+    }
+    if cursor:
+        headers["X-Export-Cursor"] = cursor
+
+    return StreamingResponse(
+        stream_export(type_, get_partitions, export_format), media_type=media_type, headers=headers
+    )
+
+
 @api_router.get(
     "/export/csv",
     name="export_csv",
     summary="Экспорт CSV с последними входами пользователей в sharestats",
     description="Формирует CSV-файл с пользователями, которые заходили на страницы со статистикой. "
-    "Файл содержит информацию о последнем входе пользователей на указанную дату.",
+    "Файл содержит информацию о последнем входе пользователей на указанную дату "
+    "или за диапазон дат (date - end_date включительно).",
 )
 async def get_last_login_csv(
     date_query: DateQuery = Depends(),
-    crud: StudentDBHandler = Depends(get_student_crud),
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format", description=EXPORT_FORMAT_DESCRIPTION),
 ):
-    students = await crud.get_students_with_last_login(date_query.search_date)
+    if date_query.is_reversed:
+        return JSONResponse(
+            content={"status": "error", "message": "end_date must not be earlier than date"},
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
 
-    return StreamingResponse(
-        iter([generate_csv(students, "last_login").getvalue().encode("utf-8-sig")]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename=students_last_login_{date_query.formatted_date}.csv",
-            "Content-Type": "text/csv; charset=utf-8-sig",
-        },
+    return get_export_response(
+        "last_login",
+        lambda session: StudentDBHandler(session).iter_students_with_last_login(
+            date_query.search_date, date_query.last_date
+        ),
+        f"students_last_login_{date_query.formatted_date}",
+        export_format,
     )
 
 
@@ -135,20 +226,24 @@ async def get_last_login_csv(
     name="adoption",
     summary="Экспорт CSV с данными о выполнении челленджей и покупке продуктов",
     description="Формирует CSV-файл с пользователями, которые хотя бы раз заходили на страницу с бонусами. "
-    "Файл содержит информацию о количествах приобретённых продуктов и выполненных челленджах.",
+    "Файл содержит информацию о количествах приобретённых продуктов и выполненных челленджах. "
+    "С параметром cursor выгружаются только студенты, изменившиеся после предыдущей выгрузки.",
 )
 async def get_adoption_csv(
-    session: AsyncSession = Depends(get_async_session),
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format", description=EXPORT_FORMAT_DESCRIPTION),
+    cursor: str | None = Query(None, description=EXPORT_CURSOR_DESCRIPTION),
 ):
-    data = await get_purchased_products_and_challenges(session)
+    try:
+        since, until, next_cursor = await get_export_window("adoption", cursor)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
-    return StreamingResponse(
-        iter([generate_csv(data, "adoption").getvalue().encode("utf-8-sig")]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=adoption.csv",
-            "Content-Type": "text/csv; charset=utf-8-sig",
-        },
+    return get_export_response(
+        "adoption",
+        lambda session: iter_purchased_products_and_challenges(session, since, until),
+        "adoption",
+        export_format,
+        next_cursor,
     )
 
 
@@ -158,45 +253,145 @@ async def get_adoption_csv(
     summary="Экспорт CSV с данными о покупках",
     description="Формирует CSV-файл с покупками. Файл содержит информацию о покупках, "
     "включая ID студента, ID продукта, дату создания и информацию о том, "
-    "кем была добавлена покупка для студента.",
+    "кем была добавлена покупка для студента. С параметром cursor выгружаются только новые покупки.",
 )
 async def get_purchases_csv(
-    crud: ProductDBHandler = Depends(get_product_crud),
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format", description=EXPORT_FORMAT_DESCRIPTION),
+    cursor: str | None = Query(None, description=EXPORT_CURSOR_DESCRIPTION),
 ):
-    data = await crud.get_all_purchased_products()
+    try:
+        since, until, next_cursor = await get_export_window("purchases", cursor)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
-    return StreamingResponse(
-        iter([generate_csv(data, "purchases").getvalue().encode("utf-8-sig")]),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=purchases.csv",
-            "Content-Type": "text/csv; charset=utf-8-sig",
-        },
+    return get_export_response(
+        "purchases",
+        lambda session: ProductDBHandler(session).iter_all_purchased_products(since, until),
+        "purchases",
+        export_format,
+        next_cursor,
     )
 
 
+@api_router.get(
+    "/analytics/distributions",
+    name="analytics_distributions",
+    summary="Распределения достижений, челленджей и баллов по профессиям и когортам",
+    description="Возвращает количество выданных достижений по типам, выполненных челленджей и начисленных баллов "
+    "в разрезе профессии и месяца начала обучения (когорты). Данные читаются из инкрементально "
+    "обновляемых роллапов, поэтому запрос дешёвый и подходит для дашбордов.",
+)
+async def get_analytics_distributions(
+    profession: ProfessionEnumWithAll = Query(ProfessionEnumWithAll.ALL, description="Код профессии, ALL - все"),
+    cohort_from: date | None = Query(None, description="Первый месяц начала обучения (день игнорируется)"),
+    cohort_to: date | None = Query(None, description="Последний месяц начала обучения (день игнорируется)"),
+    crud: AnalyticsDBHandler = Depends(get_analytics_crud),
+):
+    try:
+        filters = {
+            "profession": None if profession == ProfessionEnumWithAll.ALL else profession.value,
+            "cohort_from": cohort_from,
+            "cohort_to": cohort_to,
+        }
+        return {
+            "achievements": [row._asdict() for row in await crud.get_achievement_distribution(**filters)],
+            "challenges": [row._asdict() for row in await crud.get_challenge_distribution(**filters)],
+            "points": [row._asdict() for row in await crud.get_points_distribution(**filters)],
+        }
+    except Exception as e:
+        logger.error(f"Failed to get analytics distributions: {e}")
+        return JSONResponse(
+            content={"status": "error", "message": "Failed to get analytics distributions"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
 @api_router.post(
     "/badges",
     name="badges",
-    summary="Добавить новые бейджи",
-    description="Стирает таблицу с бейджами и создаёт новые записи с бейджами в БД",
+    summary="Добавить новые бейджи",
+    description="Заменяет таблицу с бейджами новыми записями. Принимает JSON-список, "
+    "NDJSON (application/x-ndjson) или CSV с заголовком (text/csv); NDJSON и CSV читаются потоково. "
+    "Если хотя бы одна запись невалидна, возвращается 422 и таблица не меняется",
 )
 async def process_badges(
-    data: list[Badge],
+    request: Request,
     crud: BadgeDBHandler = Depends(get_badges_crud),
 ):
     try:
-        await crud.process_badges_batch(data)
+        results = await crud.process_badges_batch(iter_badges(request))
+        # Без свежего кэша типы бейджей устаревшие: карточки сгенерируются по запросу
+        results["render_job_id"] = (
+            start_render_job(badges_cache.get_types()).id if results.pop("cache_refreshed") else None
+        )
         return JSONResponse(
-            {"status": "OK", "message": "Badges processed"},
+            {"status": "OK", "message": "Badges processed", **results},
             status_code=status.HTTP_200_OK,
         )
+    except BadgeBodyError as e:
+        return JSONResponse(
+            content={"status": "error", "message": str(e)}, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
     except Exception as e:
         return JSONResponse(
             content={"status": "error", "message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+@api_router.get(
+    "/badges/render/{job_id}",
+    name="badges_render_status",
+    summary="Статус генерации карточек бейджей",
+    description="Возвращает количество сгенерированных, ожидающих и неудавшихся карточек для загрузки бейджей",
+)
+async def get_badges_render_status(job_id: str):
+    job = render_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            content={"status": "error", "message": f"Job {job_id} not found"}, status_code=status.HTTP_404_NOT_FOUND
+        )
+    return job.to_dict()
+
+
+@api_router.post(
+    "/cache/reload",
+    name="cache_reload",
+    summary="Перезагрузить данные из Google Sheets",
+    description="Запускает в фоне перезагрузку указанного листа (или всех листов) в кэш приложения. "
+    "Возвращает id задачи: новая версия данных и количество строк по каждому листу - в /cache/reload/{job_id}. "
+    "Сбрасываются только кэши, зависящие от перезагруженного листа",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def reload_cache(
+    sheet: str | None = Query(None, description="Название листа. Если не указано, перезагружаются все листы"),
+    force: bool = Query(False, description="Разобрать лист, даже если его содержимое не изменилось"),
+):
+    if sheet is not None and sheet not in SHEET_UPDATERS:
+        return JSONResponse(
+            content={"status": "error", "message": f"Unknown sheet {sheet}. Available: {', '.join(SHEET_UPDATERS)}"},
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    sheet_names = [sheet] if sheet else list(SHEET_UPDATERS)
+    job = start_reload_job(mock_data_loader, data_cache, sheet_names, force)
+    return JSONResponse(job.to_dict(), status_code=status.HTTP_202_ACCEPTED)
+
+
+@api_router.get(
+    "/cache/reload/{job_id}",
+    name="cache_reload_status",
+    summary="Статус перезагрузки данных из Google Sheets",
+    description="Возвращает статус задачи перезагрузки, новую версию данных и количество строк по каждому листу",
+)
+async def get_reload_cache_status(job_id: str):
+    job = reload_jobs.get(job_id)
+    if not job:
+        return JSONResponse(
+            content={"status": "error", "message": f"Job {job_id} not found"}, status_code=status.HTTP_404_NOT_FOUND
+        )
+    return job.to_dict()
+
+
 @open_api_router.get(
     "/api/badges/{badge_id}",
     name="badges",
@@ -206,11 +401,13 @@ async def process_badges(
 async def get_badges(badge_id: int, crud: BadgeDBHandler = Depends(get_badges_crud)):
     try:
         badge = await crud.get_badge_by_id(badge_id)
-        badge = badge.to_badge_model()
-        image_data = await find_or_generate_image(badge, "tg_badge")
-        data = badge.model_dump()
-        data.update({"sharing_card_url": image_data["url"]})
-        return data
+        if not badge:
+            return JSONResponse(
+                content={"status": "error", "message": "Badge not found"}, status_code=status.HTTP_404_NOT_FOUND
+            )
+
+        image_data = await get_badge_card(badge, "tg_badge")
+        return {**badge._asdict(), "sharing_card_url": image_data["url"]}
     except Exception as e:
         return JSONResponse(
             content={"status": "error", "message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
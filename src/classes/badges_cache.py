@@ -0,0 +1,76 @@
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from src.classes.decorators import singleton
+from src.db.models import BadgeDB
+from src.models import Badge
+
+
+class BadgeRecord(NamedTuple):
+    id: int
+    badge_type: str
+    student_id: int
+    student_name: str
+    title: str
+    description: str
+
+    def to_badge_model(self) -> Badge:
+        return Badge(**self._asdict())
+
+
+@singleton
+class BadgesCache:
+    """Бейджи в памяти процесса. Версия - OID таблицы badges, который меняется при каждой загрузке бейджей"""
+
+    def __init__(self, check_interval: int = 60):
+        self.version: int | None = None
+        self._badges: Mapping[int, BadgeRecord] = MappingProxyType({})
+        self._cards: dict[tuple[str, str], dict] = {}
+        self._checked_at = 0.0
+        self._check_interval = check_interval
+        self._lock = asyncio.Lock()
+
+    async def get(self, session: AsyncSession, badge_id: int) -> BadgeRecord | None:
+        # Раз в check_interval проверяем, не загрузил ли бейджи другой процесс
+        if self.version is None or time.monotonic() - self._checked_at > self._check_interval:
+            await self.refresh(session)
+        return self._badges.get(badge_id)
+
+    async def refresh(self, session: AsyncSession) -> None:
+        async with self._lock:
+            version = (await session.execute(text("SELECT 'badges'::regclass::oid"))).scalar_one()
+            if version != self.version:
+                await self.load(session, version)
+            self._checked_at = time.monotonic()
+
+    async def load(self, session: AsyncSession, version: int) -> None:
+        result = await session.execute(select(*(getattr(BadgeDB, column) for column in BadgeRecord._fields)))
+        self._badges = MappingProxyType({row[0]: BadgeRecord(*row) for row in result.all()})
+        self._cards = {}
+        self.version = version
+
+    def get_types(self) -> list[BadgeRecord]:
+        """По одному бейджу каждого типа - карточки генерируются по типу, а не по студенту"""
+        by_type = {}
+        for badge in self._badges.values():
+            by_type.setdefault(badge.badge_type, badge)
+        return list(by_type.values())
+
+    def get_card(self, badge_type: str, orientation: str) -> dict | None:
+        return self._cards.get((badge_type, orientation))
+
+    def set_card(self, badge_type: str, orientation: str, image_data: dict) -> None:
+        self._cards[(badge_type, orientation)] = image_data
+
+    def __len__(self) -> int:
+        return len(self._badges)
+
+
+# Общий для приложения и слоя БД: загрузка бейджей обновляет тот же экземпляр, из которого читают страницы
+badges_cache = BadgesCache()
@@ -1,28 +1,137 @@
+import hashlib
+import json
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Mapping
+
 from loguru import logger
 from pydantic import ValidationError
 
 from src.classes.decorators import singleton
 from src.models import Challenge, Meme, Product
 
+# Лист Google Sheets -> метод DataCache, который его разбирает
+SHEET_UPDATERS = {
+    "mock": "update_stats",
+    "courses": "update_courses",
+    "skills_detailed": "update_skills_details",
+    "professions": "update_professions_info",
+    "memes": "update_meme_data",
+}
+
+
+def _freeze(data: dict) -> Mapping:
+    return MappingProxyType(data)
+
+
+@dataclass(frozen=True, slots=True)
+class DataSnapshot:
+    """Неизменяемый срез данных из Google Sheets вместе с производными индексами"""
+
+    version: int = 0
+    stats: Mapping[int, dict[str, int | str]] = field(default_factory=lambda: _freeze({}))
+    courses: Mapping[int, dict[str, int | str]] = field(default_factory=lambda: _freeze({}))
+    meme_data: Mapping[str, Meme] = field(default_factory=lambda: _freeze({}))
+    meme_questions: Mapping[str, str] = field(default_factory=lambda: _freeze({}))
+    professions_info: Mapping[str, str] = field(default_factory=lambda: _freeze({}))
+    skills_details: Mapping[int, Mapping[int, dict[str, str]]] = field(default_factory=lambda: _freeze({}))
+    skills_thresholds: Mapping[int, tuple[int, ...]] = field(default_factory=lambda: _freeze({}))
+    skills_levels: Mapping[int, tuple[dict[str, str], ...]] = field(default_factory=lambda: _freeze({}))
+    sheet_versions: Mapping[str, int] = field(default_factory=lambda: _freeze({}))
+
+    def sheet_version(self, sheet_name: str) -> int:
+        """Версия среза, в которой последний раз менялся лист. Подходит для ключей зависимых кэшей"""
+        return self.sheet_versions.get(sheet_name, 0)
+
+    def get_skills(self, program: int, lessons_completed: int) -> list[dict[str, str]]:
+        """Навыки программы, пороги которых не превышают число пройденных уроков"""
+        thresholds = self.skills_thresholds.get(program, ())
+        return list(self.skills_levels.get(program, ())[: bisect_right(thresholds, lessons_completed)])
+
+    def row_counts(self) -> dict[str, int]:
+        return {
+            "mock": len(self.stats),
+            "courses": len(self.courses),
+            "skills_detailed": sum(len(skills) for skills in self.skills_details.values()),
+            "professions": len(self.professions_info),
+            "memes": len(self.meme_data),
+        }
+
 
 @singleton
 class DataCache:
     def __init__(self):
-        self.stats: dict[int, dict[str, int | str]] = {}
-        self.courses: dict[int, dict[str, int | str]] = {}
-        self.meme_data: dict[str, Meme] = {}
-        self.professions_info: dict[str, str] = {}
-        self.skills_details: dict[int, dict[int, dict[str, str]]] = {}
+        self._snapshot = DataSnapshot()
+        self._write_lock = threading.Lock()
+        self._sheet_hashes: dict[str, str] = {}
+        self._meme_headers: list[str] = []
+        self._meme_rows: dict[tuple[str, ...], Meme] = {}
         self.skills: dict[int, dict[int, str]] = {}  # DEPRECATED
         self.challenges: dict[str, Challenge] = {}  # DEPRECATED
         self.products: dict[str, Product] = {}  # DEPRECATED
 
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """Текущий срез данных. Для согласованного чтения нескольких полей сохраните его в локальную переменную"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def stats(self) -> Mapping[int, dict[str, int | str]]:
+        return self._snapshot.stats
+
+    @property
+    def courses(self) -> Mapping[int, dict[str, int | str]]:
+        return self._snapshot.courses
+
+    @property
+    def meme_data(self) -> Mapping[str, Meme]:
+        return self._snapshot.meme_data
+
+    @property
+    def professions_info(self) -> Mapping[str, str]:
+        return self._snapshot.professions_info
+
+    @property
+    def skills_details(self) -> Mapping[int, Mapping[int, dict[str, str]]]:
+        return self._snapshot.skills_details
+
+    @property
+    def loaded_sheets(self) -> frozenset[str]:
+        return frozenset(self._sheet_hashes)
+
+    def update_sheet(self, sheet_name: str, data: list, force: bool = False) -> bool:
+        """Разбирает данные листа, только если его содержимое изменилось с прошлой загрузки"""
+        content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        content_hash = hashlib.sha1(content, usedforsecurity=False).hexdigest()
+        if not force and self._sheet_hashes.get(sheet_name) == content_hash:
+            return False
+
+        getattr(self, SHEET_UPDATERS[sheet_name])(data)
+        self._sheet_hashes[sheet_name] = content_hash
+        return True
+
+    def _publish(self, sheet_name: str, **changes) -> DataSnapshot:
+        """Собирает новый срез и публикует его одной заменой ссылки"""
+        with self._write_lock:
+            version = self._snapshot.version + 1
+            sheet_versions = _freeze({**self._snapshot.sheet_versions, sheet_name: version})
+            snapshot = replace(self._snapshot, version=version, sheet_versions=sheet_versions, **changes)
+            self._snapshot = snapshot
+        return snapshot
+
     def update_stats(self, mock_data: list):
         headers = mock_data[0]
-        self.stats = {
+        stats = {
             int(row[0]): dict(zip(headers, [int(value) if value.isdigit() else value for value in row], strict=False))
             for row in mock_data[1:]
         }
+        self._publish("mock", stats=_freeze(stats))
 
     # DEPRECATED, changed to update_skills_details
     def update_skills(self, skills_data: list):
@@ -31,6 +140,8 @@ class DataCache:
             self.skills[int(row[1])].update({int(row[2]): row[3]})
 
     def update_skills_details(self, skills_details: list):
+        details: dict[int, dict[int, dict[str, str]]] = {}
+
         for row in skills_details[1:]:
             if not row[0]:
                 break
@@ -43,20 +154,34 @@ class DataCache:
             skill = row[5]
             skill_extended = row[6]
 
-            self.skills_details.setdefault(program, {})[lessons_completed] = {
+            details.setdefault(program, {})[lessons_completed] = {
                 "skill_short": skill,
                 "skill_extended": skill_extended,
             }
 
+        thresholds, levels = {}, {}
+        for program, program_skills in details.items():
+            ordered = sorted(program_skills)
+            thresholds[program] = tuple(ordered)
+            levels[program] = tuple(program_skills[lessons] for lessons in ordered)
+
+        self._publish(
+            "skills_detailed",
+            skills_details=_freeze({program: _freeze(skills) for program, skills in details.items()}),
+            skills_thresholds=_freeze(thresholds),
+            skills_levels=_freeze(levels),
+        )
+
     def update_courses(self, courses_data: list):
         headers = courses_data[0]
-        self.courses = {
+        courses = {
             int(row[1]): dict(zip(headers, [int(value) if value.isdigit() else value for value in row], strict=False))
             for row in courses_data[1:]
         }
+        self._publish("courses", courses=_freeze(courses))
 
     def update_professions_info(self, professions_data: list):
-        self.professions_info = {row[0]: row[3] for row in professions_data[1:]}
+        self._publish("professions", professions_info=_freeze({row[0]: row[3] for row in professions_data[1:]}))
 
     # DEPRECATED
     def update_challenges(self, challenges_data: list):
@@ -98,16 +223,34 @@ class DataCache:
 
     def update_meme_data(self, meme_data: list):
         headers = meme_data[0]
-        self.meme_data.clear()
+        # Строки, не изменившиеся с прошлой загрузки, повторно не валидируем
+        previous_rows = self._meme_rows if headers == self._meme_headers else {}
+        rows: dict[tuple[str, ...], Meme] = {}
+        memes: dict[str, Meme] = {}
+        validated = 0
 
         for row in meme_data[1:]:
-            try:
-                meme_dict = dict(zip(headers, [value.strip() for value in row], strict=False))
-                meme = Meme(**meme_dict)
-                self.meme_data[meme.id] = meme
-            except ValidationError as e:
-                logger.error(f"Error while validating data for meme {row[0]}: {e}")
-            except Exception as e:
-                logger.error(f"Unexpected error while loading data for meme {row[0]}: {e}")
+            values = tuple(value.strip() for value in row)
+            meme = previous_rows.get(values)
+
+            if meme is None:
+                try:
+                    meme = Meme(**dict(zip(headers, values, strict=False)))
+                    validated += 1
+                except ValidationError as e:
+                    logger.error(f"Error while validating data for meme {row[0]}: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Unexpected error while loading data for meme {row[0]}: {e}")
+                    continue
+
+            rows[values] = meme
+            memes[meme.id] = meme
 
-        logger.info(f"Loaded {len(self.meme_data)} memes")
+        self._meme_headers, self._meme_rows = headers, rows
+        self._publish(
+            "memes",
+            meme_data=_freeze(memes),
+            meme_questions=_freeze({meme.id: meme.question for meme in memes.values()}),
+        )
+        logger.info(f"Loaded {len(memes)} memes ({validated} validated, {len(memes) - validated} reused)")
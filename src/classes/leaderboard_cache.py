@@ -0,0 +1,40 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from src.classes.decorators import singleton
+
+
+@singleton
+class LeaderboardCache:
+    """Рейтинг достижений для /results и отрендеренные страницы. Версия - хэш строк рейтинга"""
+
+    def __init__(self, ttl: int = 60):
+        self.version: int | None = None
+        self._achievements: list[dict] = []
+        self._pages: dict[str, bytes] = {}
+        self._loaded_at = 0.0
+        self._ttl = ttl
+        self._lock = asyncio.Lock()
+
+    async def get(self, load: Callable[[], Awaitable[list[dict]]]) -> list[dict]:
+        if self.version is None or time.monotonic() - self._loaded_at > self._ttl:
+            async with self._lock:
+                # Пока ждали блокировку, рейтинг мог обновить другой запрос
+                if self.version is None or time.monotonic() - self._loaded_at > self._ttl:
+                    self.update(await load())
+        return self._achievements
+
+    def update(self, achievements: list[dict]) -> None:
+        version = hash(tuple(tuple(achievement.items()) for achievement in achievements))
+        if version != self.version:
+            self._achievements = achievements
+            self._pages = {}
+            self.version = version
+        self._loaded_at = time.monotonic()
+
+    def get_page(self, key: str) -> bytes | None:
+        return self._pages.get(key)
+
+    def set_page(self, key: str, body: bytes) -> None:
+        self._pages[key] = body
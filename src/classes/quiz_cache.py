@@ -0,0 +1,17 @@
+from src.classes.decorators import singleton
+
+
+@singleton
+class QuizCache:
+    """Отрендеренные вопросы квиза. Версия - sheet_version("memes"): перезагрузка других листов кэш не сбрасывает"""
+
+    def __init__(self):
+        self.version: int | None = None
+        self._questions = ""
+
+    def get(self, version: int) -> str | None:
+        return self._questions if version == self.version else None
+
+    def set(self, version: int, questions: str) -> None:
+        self._questions = questions
+        self.version = version
@@ -0,0 +1,132 @@
+from datetime import date
+from typing import Sequence
+
+from fastapi import Depends
+from sqlalchemy import Date, Row, String, cast, literal, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import func, select
+
+from src.db.models import (
+    AchievementDB,
+    AchievementRollup,
+    ChallengeRollup,
+    ChallengesDB,
+    StudentChallenge,
+    StudentDB,
+)
+from src.db.session import get_async_session
+
+# Литерал, а не параметр: выражение повторяется в GROUP BY и должно совпадать с SELECT
+COHORT = cast(func.date_trunc(literal_column("'month'"), StudentDB.started_at), Date)
+
+
+async def add_achievement_rollup(session: AsyncSession, student_id: int, achievement_id: int) -> None:
+    """+1 в когорту студента. Вызывается в транзакции, которая вставляет строку в student_achievements"""
+    rows = (
+        select(cast(AchievementDB.type, String), cast(StudentDB.profession, String), COHORT, literal(1))
+        .join(AchievementDB, AchievementDB.id == achievement_id)
+        .where(StudentDB.id == student_id)
+    )
+    statement = insert(AchievementRollup).from_select(
+        ["achievement_type", "profession", "cohort", "receive_count"], rows
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["achievement_type", "profession", "cohort"],
+        set_={"receive_count": AchievementRollup.receive_count + statement.excluded.receive_count},
+    )
+    await session.execute(statement)
+
+
+async def add_challenge_rollups(session: AsyncSession, student_challenge_ids: list[int]) -> None:
+    """Добавляет только что вставленные выполнения челленджей в роллапы одним запросом"""
+    if not student_challenge_ids:
+        return
+
+    rows = (
+        select(
+            StudentChallenge.challenge_id,
+            cast(StudentDB.profession, String),
+            COHORT,
+            func.count(),
+            func.sum(ChallengesDB.value),
+        )
+        .join(StudentDB, StudentDB.id == StudentChallenge.student_id)
+        .join(ChallengesDB, ChallengesDB.id == StudentChallenge.challenge_id)
+        .where(StudentChallenge.id.in_(student_challenge_ids))
+        .group_by(StudentChallenge.challenge_id, StudentDB.profession, COHORT)
+    )
+    statement = insert(ChallengeRollup).from_select(
+        ["challenge_id", "profession", "cohort", "completed_count", "points_earned"], rows
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["challenge_id", "profession", "cohort"],
+        set_={
+            "completed_count": ChallengeRollup.completed_count + statement.excluded.completed_count,
+            "points_earned": ChallengeRollup.points_earned + statement.excluded.points_earned,
+        },
+    )
+    await session.execute(statement)
+
+
+class AnalyticsDBHandler:
+    """Распределения для дашбордов. Читают только роллапы, без обхода students и student_achievements"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @staticmethod
+    def _filter(query, model, profession: str | None, cohort_from: date | None, cohort_to: date | None):
+        if profession:
+            query = query.where(model.profession == profession)
+        if cohort_from:
+            query = query.where(model.cohort >= cohort_from.replace(day=1))
+        if cohort_to:
+            query = query.where(model.cohort <= cohort_to.replace(day=1))
+        return query
+
+    async def get_achievement_distribution(
+        self, profession: str | None = None, cohort_from: date | None = None, cohort_to: date | None = None
+    ) -> Sequence[Row]:
+        query = select(
+            AchievementRollup.achievement_type,
+            AchievementRollup.profession,
+            AchievementRollup.cohort,
+            AchievementRollup.receive_count,
+        ).order_by(AchievementRollup.cohort, AchievementRollup.profession, AchievementRollup.achievement_type)
+        query = self._filter(query, AchievementRollup, profession, cohort_from, cohort_to)
+        return (await self.session.execute(query)).all()
+
+    async def get_challenge_distribution(
+        self, profession: str | None = None, cohort_from: date | None = None, cohort_to: date | None = None
+    ) -> Sequence[Row]:
+        query = select(
+            ChallengeRollup.challenge_id,
+            ChallengeRollup.profession,
+            ChallengeRollup.cohort,
+            ChallengeRollup.completed_count,
+            ChallengeRollup.points_earned,
+        ).order_by(ChallengeRollup.cohort, ChallengeRollup.profession, ChallengeRollup.challenge_id)
+        query = self._filter(query, ChallengeRollup, profession, cohort_from, cohort_to)
+        return (await self.session.execute(query)).all()
+
+    async def get_points_distribution(
+        self, profession: str | None = None, cohort_from: date | None = None, cohort_to: date | None = None
+    ) -> Sequence[Row]:
+        """Баллы за челленджи по профессии и когорте - свёртка того же роллапа по челленджам"""
+        query = (
+            select(
+                ChallengeRollup.profession,
+                ChallengeRollup.cohort,
+                func.sum(ChallengeRollup.completed_count).label("completed_count"),
+                func.sum(ChallengeRollup.points_earned).label("points_earned"),
+            )
+            .group_by(ChallengeRollup.profession, ChallengeRollup.cohort)
+            .order_by(ChallengeRollup.cohort, ChallengeRollup.profession)
+        )
+        query = self._filter(query, ChallengeRollup, profession, cohort_from, cohort_to)
+        return (await self.session.execute(query)).all()
+
+
+async def get_analytics_crud(session: AsyncSession = Depends(get_async_session)) -> AnalyticsDBHandler:
+    return AnalyticsDBHandler(session)
@@ -1,32 +1,102 @@
+import time
+from typing import AsyncIterable
+
 from fastapi import Depends
 from loguru import logger
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db.models import BadgeDB
+from src.classes.badges_cache import BadgeRecord, badges_cache
 from src.db.session import get_async_session
 from src.models import Badge
 
+BADGE_COLUMNS = ("id", "badge_type", "student_id", "student_name", "title", "description")
+
+# Новые бейджи загружаются в badges_staging и подменяют таблицу целиком в конце транзакции
+CREATE_STAGING_STATEMENTS = (
+    "DROP TABLE IF EXISTS badges_staging",
+    "CREATE TABLE badges_staging (LIKE badges INCLUDING ALL)",
+)
+SWAP_STATEMENTS = (
+    "ALTER TABLE badges RENAME TO badges_old",
+    "ALTER TABLE badges_staging RENAME TO badges",
+    "ALTER SEQUENCE IF EXISTS badges_id_seq OWNED BY badges.id",
+)
+# LIKE ... INCLUDING ALL генерирует имена индексов от badges_staging. Индексы новой таблицы получают имена
+# индексов старой с тем же определением; вместе с индексом переименовывается и ограничение (pkey, unique)
+RENAME_INDEXES_STATEMENT = text(
+    r"""
+    WITH indexes AS (
+        SELECT pg_index.indrelid, pg_index.indisunique, index.relname AS name,
+            regexp_replace(pg_get_indexdef(pg_index.indexrelid), '^CREATE (UNIQUE )?INDEX \S+ ON \S+', '') AS definition
+        FROM pg_index JOIN pg_class AS index ON index.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid IN ('badges'::regclass, 'badges_old'::regclass)
+    )
+    SELECT format('ALTER INDEX %I RENAME TO %I', current.name, previous.name)
+    FROM indexes AS current JOIN indexes AS previous USING (definition, indisunique)
+    WHERE current.indrelid = 'badges'::regclass AND previous.indrelid = 'badges_old'::regclass
+    """
+)
+
 
 class BadgeDBHandler:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_badge_by_id(self, id_: int) -> BadgeDB | None:
+    async def get_badge_by_id(self, id_: int) -> BadgeRecord | None:
         try:
-            return await self.session.get(BadgeDB, id_)
+            return await badges_cache.get(self.session, id_)
         except Exception as e:
             logger.error(f"Failed to get badge by id: {e}")
 
-    async def process_badges_batch(self, badges: list[Badge]):
+    async def process_badges_batch(self, badges: AsyncIterable[Badge]) -> dict:
+        """Заменяет все бейджи потоковой загрузкой через COPY. Ошибка в потоке бейджей откатывает загрузку,
+        таблица остаётся прежней. cache_refreshed - кэш уже видит новые бейджи"""
+        results = {"rows": 0}
+        started = time.perf_counter()
+
+        async def records():
+            async for badge in badges:
+                results["rows"] += 1
+                yield tuple(getattr(badge, column) for column in BADGE_COLUMNS)
+
         try:
-            await self.session.execute(text("TRUNCATE TABLE badges"))
-            new_badges = [BadgeDB(**badge.model_dump()) for badge in badges]
-            self.session.add_all(new_badges)
+            for statement in CREATE_STAGING_STATEMENTS:
+                await self.session.execute(text(statement))
+
+            connection = await self.session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                "badges_staging", records=records(), columns=BADGE_COLUMNS
+            )
+
+            for statement in SWAP_STATEMENTS:
+                await self.session.execute(text(statement))
+            rename_statements = (await self.session.execute(RENAME_INDEXES_STATEMENT)).scalars().all()
+            await self.session.execute(text("DROP TABLE badges_old"))
+            for statement in rename_statements:
+                await self.session.execute(text(statement))
             await self.session.commit()
         except Exception as e:
             logger.error(f"Failed to process badges: {e}")
             await self.session.rollback()
+            raise
+
+        # Бейджи уже заменены: ошибка обновления кэша не делает загрузку неудачной.
+        # Кэш перечитает таблицу при следующей проверке версии, не позже check_interval
+        try:
+            await badges_cache.refresh(self.session)
+            results["cache_refreshed"] = True
+        except Exception as e:
+            logger.error(f"Failed to refresh badges cache after upload: {e}")
+            await self.session.rollback()
+            results["cache_refreshed"] = False
+
+        seconds = time.perf_counter() - started
+        results["seconds"] = round(seconds, 3)
+        results["rows_per_sec"] = round(results["rows"] / seconds) if seconds else 0
+        logger.info(f"Loaded {results['rows']} badges in {results['seconds']} s ({results['rows_per_sec']} rows/s)")
+        return results
 
 
 async def get_badges_crud(session: AsyncSession = Depends(get_async_session)) -> BadgeDBHandler:
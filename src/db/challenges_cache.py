@@ -0,0 +1,59 @@
+import time
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from src.classes.decorators import singleton
+from src.db.models import ChallengesDB
+from src.models import ProfessionEnumWithAll
+
+
+@singleton
+class ChallengesCache:
+    """Активные челленджи по профессиям. Сбрасывается при изменении челленджей через API"""
+
+    def __init__(self, ttl: int = 5 * 60):
+        self._by_profession: Mapping[str, tuple[ChallengesDB, ...]] | None = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._ttl = ttl
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._by_profession = None
+
+    async def get_active(self, session: AsyncSession, profession: str) -> tuple[ChallengesDB, ...]:
+        """Активные челленджи профессии, включая челленджи для всех профессий (ALL)"""
+        by_profession = self._by_profession
+        # TTL страхует от устаревания, если челленджи изменили через другой процесс
+        if by_profession is None or time.monotonic() - self._loaded_at > self._ttl:
+            by_profession = await self._load(session)
+        return by_profession.get(profession, by_profession[ProfessionEnumWithAll.ALL.value])
+
+    async def _load(self, session: AsyncSession) -> Mapping[str, tuple[ChallengesDB, ...]]:
+        generation = self._generation
+
+        result = await session.execute(select(ChallengesDB).where(ChallengesDB.is_active == True))  # noqa
+        challenges = list(result.scalars().all())
+        for challenge in challenges:
+            session.expunge(challenge)
+
+        common = tuple(c for c in challenges if c.profession == ProfessionEnumWithAll.ALL)
+        by_profession = {
+            profession.value: common + tuple(c for c in challenges if c.profession == profession)
+            for profession in ProfessionEnumWithAll
+            if profession != ProfessionEnumWithAll.ALL
+        }
+        by_profession[ProfessionEnumWithAll.ALL.value] = common
+        by_profession = MappingProxyType(by_profession)
+
+        # Не публикуем результат, если за время загрузки кэш успели сбросить
+        if generation == self._generation:
+            self._by_profession, self._loaded_at = by_profession, time.monotonic()
+        return by_profession
+
+
+# Общий для всех запросов процесса: обработчики БД получают его отсюда, а не из src.dependencies
+challenges_cache = ChallengesCache()
@@ -1,15 +1,17 @@
-import json
-
 from fastapi import Depends
 from loguru import logger
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-from sqlmodel import not_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlmodel import select
 
+from src.db.analytics_crud import add_challenge_rollups
+from src.db.challenges_cache import challenges_cache
+from src.db.ledger import add_earned_points
 from src.db.models import ChallengesDB, StudentChallenge, StudentDB
 from src.db.session import get_async_session
+from src.db.upsert import upsert_batch
 from src.models import Challenge
-from src.services.safe_eval import safe_eval_condition
+from src.services.challenges_scoring import score_all_students
+from src.services.safe_eval import compile_condition, safe_eval_condition
 
 
 class ChallengeDBHandler:
@@ -20,110 +22,64 @@ class ChallengeDBHandler:
         result = await self.session.execute(select(ChallengesDB).where(ChallengesDB.id == challenge_id))
         return result.scalar_one_or_none()
 
-    async def get_all_challenges(
-        self, active_only: bool = False, profession: str | None = None, exclude_ids: list = None
-    ) -> list[ChallengesDB]:
-        query = select(ChallengesDB)
-
-        if active_only:
-            query = query.where(ChallengesDB.is_active == True)  # noqa
-
-        if profession:
-            query = query.where(or_(ChallengesDB.profession == profession, ChallengesDB.profession == "ALL"))
-
-        if exclude_ids:
-            query = query.where(not_(ChallengesDB.id.in_(exclude_ids)))
-
-        result = await self.session.execute(query)
-        return list(result.scalars().all())
-
-    async def create_challenge(self, challenge: Challenge) -> ChallengesDB | None:
-        try:
-            db_challenge = ChallengesDB(**challenge.model_dump())
-            self.session.add(db_challenge)
-            await self.session.commit()
-            await self.session.refresh(db_challenge)
-            logger.info(f"Created challenge {db_challenge.id}")
-            return db_challenge
-        except Exception as e:
-            logger.error(f"Failed to create challenge: {e}")
-            await self.session.rollback()
-            return None
-
-    async def update_challenge(self, challenge: Challenge) -> ChallengesDB | None:
-        db_challenge = await self.get_challenge(challenge.id)
-        if not db_challenge:
-            return None
-
-        try:
-            for key, value in challenge.model_dump().items():
-                setattr(db_challenge, key, value)
-
-            await self.session.commit()
-            await self.session.refresh(db_challenge)
-            logger.info(f"Updated challenge {db_challenge.id}")
-            return db_challenge
-        except Exception as e:
-            logger.error(f"Failed to update challenge {db_challenge.id}: {e}")
-            await self.session.rollback()
-            return None
-
     async def process_challenges_batch(self, challenges: list[Challenge]) -> dict:
         results = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0}
 
+        rows = []
         for challenge in challenges:
             try:
-                existing_challenge = await self.get_challenge(challenge.id)
-
-                if existing_challenge is None:
-                    new_challenge = await self.create_challenge(challenge)
-                    if new_challenge:
-                        results["created"] += 1
-                    else:
-                        results["failed"] += 1
-                elif (
-                    existing_challenge.is_active != challenge.is_active
-                    or existing_challenge.title != challenge.title
-                    or existing_challenge.eval != challenge.eval
-                    or existing_challenge.value != challenge.value
-                ):
-                    updated_challenge = await self.update_challenge(challenge)
-                    if updated_challenge:
-                        results["updated"] += 1
-                    else:
-                        results["failed"] += 1
-                else:
-                    results["unchanged"] += 1
-            except Exception as e:
-                logger.error(f"Failed to process challenge {challenge.id}: {e}")
+                compile_condition(challenge.eval)
+                rows.append(challenge.model_dump())
+            except ValueError as e:
+                logger.error(f"Rejected challenge {challenge.id} with invalid condition {challenge.eval!r}: {e}")
                 results["failed"] += 1
 
+        activated_ids = []
+        if rows:
+            activated_ids = await self.get_activated_challenge_ids(rows)
+            await upsert_batch(self.session, ChallengesDB.__table__, rows, results)
+
+        if results["created"] or results["updated"]:
+            challenges_cache.invalidate()
+
+        # Новые и включённые челленджи проверяются пакетно по всем студентам.
+        # Очередь - только для пересчёта одного студента при изменении его статистики
+        if activated_ids:
+            session_maker = async_sessionmaker(self.session.bind, expire_on_commit=False)
+            scored = await score_all_students(session_maker, challenge_ids=activated_ids)
+            results["completed"] = scored["completed"]
+
+        logger.info(f"Processed challenges batch: {results}")
         return results
 
-    async def get_students_with_challenges(self) -> list[StudentDB]:
-        # Получаем всех студентов с их текущими челленджами
-        statement = select(StudentDB).options(joinedload(StudentDB.student_challenges))
-        students = await self.session.execute(statement)
-        return list(students.unique().scalars().all())
+    async def get_activated_challenge_ids(self, rows: list[dict]) -> list[str]:
+        """Новые и включённые челленджи пакета: их нужно проверить у всех студентов"""
+        query = select(ChallengesDB.id).where(ChallengesDB.id.in_([row["id"] for row in rows]), ChallengesDB.is_active)
+        active_ids = set((await self.session.execute(query)).scalars().all())
+        return [row["id"] for row in rows if row["is_active"] and row["id"] not in active_ids]
+
+    async def get_available_challenges(self, profession: str, completed_ids: set[str]) -> list[ChallengesDB]:
+        active_challenges = await challenges_cache.get_active(self.session, profession)
+        return [challenge for challenge in active_challenges if challenge.id not in completed_ids]
 
     async def update_student_challenges(
         self, student: StudentDB, student_challenges: list[ChallengesDB]
     ) -> tuple[list[ChallengesDB], list[ChallengesDB]]:
-        student_stats = json.loads(student.statistics)
-        completed_challenges_ids = [c.id for c in student_challenges] if student_challenges else []
+        student_stats = student.statistics
+        completed_challenges_ids = {c.id for c in student_challenges} if student_challenges else set()
 
-        available_challenges = await self.get_all_challenges(
-            active_only=True, profession=student.profession.name, exclude_ids=completed_challenges_ids
-        )
+        available_challenges = await self.get_available_challenges(student.profession.name, completed_challenges_ids)
 
         total_points_earned = 0
         new_completed_challenges = []
+        new_student_challenges = []
 
         for challenge in available_challenges:
             try:
                 if safe_eval_condition(challenge.eval, student_stats):
                     new_challenge = StudentChallenge(student_id=student.id, challenge_id=challenge.id)
                     self.session.add(new_challenge)
+                    new_student_challenges.append(new_challenge)
                     total_points_earned += challenge.value
                     new_completed_challenges.append(challenge)
                     logger.info(
@@ -136,7 +92,10 @@ class ChallengeDBHandler:
 
         if new_completed_challenges:
             try:
-                student.points += total_points_earned
+                await self.session.flush()
+                earned = [(student.id, challenge.id, challenge.value) for challenge in new_completed_challenges]
+                await add_earned_points(self.session, earned)
+                await add_challenge_rollups(self.session, [completed.id for completed in new_student_challenges])
                 await self.session.commit()
                 logger.info(
                     f"Added {len(new_completed_challenges)} new challenges for student {student.id}. "
@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlmodel import select
+
+
+class ExportKey(NamedTuple):
+    """Позиция строки в дельта-выгрузке: (время изменения, id). Однозначна и при одинаковом времени"""
+
+    ts: datetime
+    id: int
+
+
+def apply_export_window(
+    query: Select,
+    ts_column: InstrumentedAttribute,
+    id_column: InstrumentedAttribute,
+    since: ExportKey | None = None,
+    until: ExportKey | None = None,
+) -> Select:
+    """Строки после since и до until включительно в порядке (ts, id).
+    Отдельное условие по ts позволяет использовать индекс по одному ts_column"""
+    key = tuple_(ts_column, id_column)
+    if since:
+        query = query.where(ts_column >= since.ts, key > tuple_(since.ts, since.id))
+    if until:
+        query = query.where(ts_column <= until.ts, key <= tuple_(until.ts, until.id))
+    return query.order_by(ts_column, id_column)
+
+
+async def get_export_until(
+    session: AsyncSession,
+    ts_column: InstrumentedAttribute,
+    id_column: InstrumentedAttribute,
+    watermark: datetime,
+    since: ExportKey | None = None,
+) -> ExportKey:
+    """Последняя строка до watermark - конец окна выгрузки. Новых строк нет - окно пустое"""
+    statement = apply_export_window(select(ts_column, id_column), ts_column, id_column, since)
+    statement = statement.where(ts_column < watermark).order_by(None).order_by(ts_column.desc(), id_column.desc())
+    row = (await session.execute(statement.limit(1))).one_or_none()
+    if row is not None:
+        return ExportKey(*row)
+    # id начинаются с 1: (watermark, 0) отсекает всё, что изменилось начиная с watermark
+    return since or ExportKey(watermark, 0)
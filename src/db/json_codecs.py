@@ -0,0 +1,10 @@
+import orjson
+
+
+def json_serializer(value) -> str:
+    # asyncpg-кодек SQLAlchemy для jsonb ожидает строку
+    return orjson.dumps(value).decode()
+
+
+def json_deserializer(value: str | bytes):
+    return orjson.loads(value)
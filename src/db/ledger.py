@@ -0,0 +1,32 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Начисления в журнал и приращение балансов одним запросом: баланс меняется только вместе с записями журнала,
+# сумма по студенту считается из вставленных строк. Приращение, а не присваивание - параллельная покупка
+# не затирается устаревшим балансом
+EARN_POINTS_STATEMENT = text(
+    """
+    WITH ledger AS (
+        INSERT INTO points_ledger (student_id, amount, kind, challenge_id, created_at)
+        SELECT student_id, amount, 'earn', challenge_id, LOCALTIMESTAMP
+        FROM unnest(
+            CAST(:student_ids AS integer[]), CAST(:amounts AS integer[]), CAST(:challenge_ids AS varchar[])
+        ) AS earned(student_id, amount, challenge_id)
+        RETURNING student_id, amount
+    )
+    UPDATE students SET points = students.points + earned.amount, updated_at = LOCALTIMESTAMP
+    FROM (SELECT student_id, sum(amount) AS amount FROM ledger GROUP BY student_id) AS earned
+    WHERE students.id = earned.student_id
+    """
+)
+
+
+async def add_earned_points(session: AsyncSession, earned: list[tuple[int, str, int]]) -> None:
+    """Начисляет баллы за челленджи: (student_id, challenge_id, amount). Вызывается в транзакции начисления"""
+    if not earned:
+        return
+
+    student_ids, challenge_ids, amounts = (list(column) for column in zip(*earned, strict=True))
+    await session.execute(
+        EARN_POINTS_STATEMENT, {"student_ids": student_ids, "challenge_ids": challenge_ids, "amounts": amounts}
+    )
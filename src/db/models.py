@@ -1,7 +1,8 @@
-import json
 from datetime import date, datetime
 
 from loguru import logger
+from sqlalchemy import Index, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
 
 from src.models import Achievement, AchievementType, Badge, ProfessionEnum, ProfessionEnumWithAll, Student, plural_text
@@ -17,6 +18,62 @@ class StudentAchievement(SQLModel, table=True):
     achievement: "AchievementDB" = Relationship(back_populates="student_achievements")
 
 
+class AchievementCounter(SQLModel, table=True):
+    """Сколько студентов получили достижение. Обновляется вместе со вставкой в student_achievements"""
+
+    __tablename__ = "achievement_counters"
+
+    achievement_id: int = Field(foreign_key="achievements.id", primary_key=True)
+    receive_count: int = 0
+
+
+class AchievementRollup(SQLModel, table=True):
+    """Выданные достижения по типу, профессии и месяцу начала обучения (когорте). Ведётся инкрементально"""
+
+    __tablename__ = "achievement_rollups"
+
+    achievement_type: str = Field(primary_key=True)
+    profession: str = Field(primary_key=True)
+    cohort: date = Field(primary_key=True)  # первое число месяца started_at
+    receive_count: int = 0
+
+
+class ChallengeRollup(SQLModel, table=True):
+    """Выполненные челленджи и начисленные за них баллы по профессии и когорте. Ведётся инкрементально"""
+
+    __tablename__ = "challenge_rollups"
+
+    challenge_id: str = Field(primary_key=True)
+    profession: str = Field(primary_key=True)
+    cohort: date = Field(primary_key=True)
+    completed_count: int = 0
+    points_earned: int = 0
+
+
+class StudentHistory(SQLModel, table=True):
+    """История студента: изменения статистики (только изменившиеся ключи) и смены достижения"""
+
+    __tablename__ = "student_history"
+    __table_args__ = (
+        Index("ix_student_history_student_id_created_at", "student_id", "created_at", "id"),
+        # Текущее достижение - первая запись индекса, без обхода записей статистики и без сортировки
+        Index(
+            "ix_student_history_achievements",
+            "student_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_where=text("achievement_id IS NOT NULL"),
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="students.id")
+    created_at: datetime | None = Field(default=None, sa_column_kwargs={"server_default": func.localtimestamp()})
+    # Новые значения изменившихся ключей, удалённый ключ - null. Первая запись - статистика целиком
+    stats_delta: dict | None = Field(default=None, sa_type=JSONB)
+    achievement_id: int | None = Field(default=None, foreign_key="achievements.id")
+
+
 class AchievementDB(SQLModel, table=True):
     __tablename__ = "achievements"
     __table_args__ = (UniqueConstraint("title", "profession"),)
@@ -61,11 +118,17 @@ class StudentDB(SQLModel, table=True):
     last_name: str | None = None
     profession: ProfessionEnum
     started_at: date
-    statistics: str = Field(default="{}")
+    statistics: dict = Field(default_factory=dict, sa_type=JSONB)
     points: int = 0
-    meme_stats: str = Field(default="{}")
-    last_login: datetime | None = None
-    bonuses_last_visited: datetime | None = None
+    meme_stats: dict = Field(default_factory=dict, sa_type=JSONB)
+    last_login: datetime | None = Field(default=None, index=True)
+    bonuses_last_visited: datetime | None = Field(default=None, index=True)
+    # Часы БД, а не приложения: по этому полю строятся окна дельта-выгрузок
+    updated_at: datetime | None = Field(
+        default=None,
+        index=True,
+        sa_column_kwargs={"server_default": func.localtimestamp(), "onupdate": func.localtimestamp()},
+    )
 
     student_achievements: list["StudentAchievement"] = Relationship(back_populates="student")
     student_challenges: list["StudentChallenge"] = Relationship(back_populates="student")
@@ -84,8 +147,8 @@ class StudentDB(SQLModel, table=True):
                 last_name=self.last_name,
                 profession=self.profession,
                 started_at=self.started_at,
-                statistics=json.loads(self.statistics),
-                meme_stats=json.loads(self.meme_stats),
+                statistics=self.statistics,
+                meme_stats=self.meme_stats,
                 points=self.points,
                 last_login=self.last_login,
                 bonuses_last_visited=self.bonuses_last_visited,
@@ -102,8 +165,8 @@ class StudentDB(SQLModel, table=True):
             last_name=student.last_name,
             profession=student.profession,
             started_at=student.started_at,
-            statistics=json.dumps(student.statistics),
-            meme_stats=json.dumps(student.meme_stats),
+            statistics=student.statistics,
+            meme_stats=student.meme_stats,
             points=student.points,
             last_login=student.last_login,
             bonuses_last_visited=student.bonuses_last_visited,
@@ -136,6 +199,7 @@ class ChallengesDB(SQLModel, table=True):
 
 class StudentProduct(SQLModel, table=True):
     __tablename__ = "student_products"
+    __table_args__ = (UniqueConstraint("student_id", "product_id", name="uq_student_product"),)
 
     id: int | None = Field(default=None, primary_key=True)
     student_id: int = Field(foreign_key="students.id")
@@ -147,6 +211,20 @@ class StudentProduct(SQLModel, table=True):
     product: "ProductDB" = Relationship(back_populates="student_products")
 
 
+class PointsLedgerEntry(SQLModel, table=True):
+    """Журнал начислений и списаний баллов, только добавление. students.points - сумма amount по студенту"""
+
+    __tablename__ = "points_ledger"
+
+    id: int | None = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="students.id", index=True)
+    amount: int  # > 0 - начисление, < 0 - списание
+    kind: str  # earn - челлендж, spend - покупка, adjust - корректировка
+    challenge_id: str | None = Field(default=None, foreign_key="challenges.id")
+    product_id: str | None = Field(default=None, foreign_key="products.id")
+    created_at: datetime | None = Field(default=None, sa_column_kwargs={"server_default": func.localtimestamp()})
+
+
 class ProductDB(SQLModel, table=True):
     __tablename__ = "products"
     id: str = Field(default=None, primary_key=True)
@@ -158,6 +236,16 @@ class ProductDB(SQLModel, table=True):
     student_products: list["StudentProduct"] = Relationship(back_populates="product")
 
 
+class IdempotencyKeyDB(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+
+    key: str = Field(primary_key=True)
+    request_hash: str
+    status_code: int
+    response: str
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
 class BadgeDB(SQLModel, table=True):
     __tablename__ = "badges"
 
@@ -5,10 +5,15 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_asyn
 from sqlmodel import SQLModel
 
 from src.config import settings
+from src.db.json_codecs import json_deserializer, json_serializer
 
 DATABASE_URL = settings.get_db_url
 
-engine = create_async_engine(DATABASE_URL)
+# Строк на один серверный fetch потоковых выгрузок (yield_per) и, значит, на один отдаваемый клиенту кусок
+EXPORT_CHUNK_SIZE = 5000
+
+# jsonb (statistics, meme_stats) кодируется и декодируется orjson прямо в кодеке asyncpg
+engine = create_async_engine(DATABASE_URL, json_serializer=json_serializer, json_deserializer=json_deserializer)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
@@ -1,17 +1,53 @@
-import json
-from datetime import date, datetime
-from typing import Sequence
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, Sequence
 
 from fastapi import Depends
-from sqlalchemy import Row
+from sqlalchemy import Row, Select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 from sqlmodel import desc, func, select
 
-from src.db.models import AchievementDB, StudentAchievement, StudentChallenge, StudentDB
-from src.db.session import get_async_session
+from src.db.analytics_crud import add_achievement_rollup
+from src.db.models import (
+    AchievementCounter,
+    AchievementDB,
+    StudentAchievement,
+    StudentChallenge,
+    StudentDB,
+    StudentHistory,
+)
+from src.db.session import EXPORT_CHUNK_SIZE, get_async_session
 from src.models import Achievement, Student
+from src.services.challenges_queue import enqueue_challenges_update
+
+
+def get_last_login_query(start_date: date, end_date: date | None = None) -> Select:
+    """Полуоткрытый диапазон по last_login использует индекс ix_students_last_login"""
+    start = datetime.combine(start_date, time.min)
+    end = datetime.combine(end_date or start_date, time.min) + timedelta(days=1)
+    return (
+        select(StudentDB.id, StudentDB.last_login)
+        .where(StudentDB.last_login >= start, StudentDB.last_login < end)
+        .order_by(StudentDB.last_login)
+    )
+
+
+def get_current_achievement_query(student_id: int) -> Select:
+    """Текущее достижение студента - последняя смена достижения в истории, первая запись частичного индекса"""
+    return (
+        select(AchievementDB)
+        .join(StudentHistory, StudentHistory.achievement_id == AchievementDB.id)
+        .where(StudentHistory.student_id == student_id, StudentHistory.achievement_id.is_not(None))
+        .order_by(desc(StudentHistory.created_at), desc(StudentHistory.id))
+        .limit(1)
+    )
+
+
+def get_stats_delta(old: dict, new: dict) -> dict:
+    """Изменившиеся ключи статистики с новыми значениями, удалённые ключи - None"""
+    return {key: new.get(key) for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
 
 
 class StudentDBHandler:
@@ -22,8 +58,12 @@ class StudentDBHandler:
         try:
             db_student = StudentDB.from_student(student)
             self.session.add(db_student)
+            # Студент вставляется до снимка статистики: запись истории ссылается на него внешним ключом
+            await self.session.flush()
+            self.add_stats_snapshot(student.id, {}, student.statistics)
             await self.session.commit()
             await self.session.refresh(db_student)
+            enqueue_challenges_update(db_student.id)
             return db_student
         except IntegrityError:
             await self.session.rollback()
@@ -35,10 +75,13 @@ class StudentDBHandler:
             return None
 
         try:
+            statistics_changed = student.statistics != db_student.statistics
+            self.add_stats_snapshot(student.id, db_student.statistics, student.statistics)
+
             db_student.first_name = student.first_name
             db_student.last_name = student.last_name
             db_student.profession = student.profession
-            db_student.statistics = json.dumps(student.statistics, ensure_ascii=False)
+            db_student.statistics = student.statistics
 
             if bonuses_visited:
                 db_student.bonuses_last_visited = datetime.now()
@@ -47,20 +90,32 @@ class StudentDBHandler:
 
             await self.session.commit()
             await self.session.refresh(db_student)
+
+            if statistics_changed:
+                enqueue_challenges_update(db_student.id)
             return db_student
         except IntegrityError:
             await self.session.rollback()
             return None
 
+    def add_stats_snapshot(self, student_id: int, old: dict, new: dict) -> None:
+        """Запись в историю только при изменении статистики и только изменившимися ключами"""
+        if delta := get_stats_delta(old, new):
+            self.session.add(StudentHistory(student_id=student_id, stats_delta=delta))
+
     async def get_student(self, student_id: int) -> StudentDB | None:
         statement = select(StudentDB).where(StudentDB.id == student_id)
         result = await self.session.execute(statement)
         return result.scalar_one_or_none()
 
-    async def get_students_with_last_login(self, target_date: date) -> Sequence[Row]:
-        statement = select(StudentDB.id, StudentDB.last_login).where(func.date(StudentDB.last_login) == target_date)
-        result = await self.session.execute(statement)
-        return result.all()
+    async def iter_students_with_last_login(
+        self, start_date: date, end_date: date | None = None
+    ) -> AsyncIterator[Sequence[Row]]:
+        """Студенты, заходившие с start_date по end_date включительно"""
+        statement = get_last_login_query(start_date, end_date).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        result = await self.session.stream(statement)
+        async for rows in result.partitions():
+            yield rows
 
     async def get_student_with_challenges(self, student_id: int) -> StudentDB | None:
         statement = (
@@ -87,14 +142,7 @@ class StudentDBHandler:
         return result.scalar_one_or_none()
 
     async def get_achievement_by_student_id(self, student_id: int) -> AchievementDB | None:
-        statement = (
-            select(AchievementDB)
-            .join(StudentAchievement)
-            .where(StudentAchievement.student_id == student_id)
-            .order_by(desc(StudentAchievement.created_at))
-            .limit(1)
-        )
-        result = await self.session.execute(statement)
+        result = await self.session.execute(get_current_achievement_query(student_id))
         return result.scalar_one_or_none()
 
     async def create_achievement(self, achievement: Achievement) -> AchievementDB:
@@ -105,41 +153,71 @@ class StudentDBHandler:
         return db_achievement
 
     async def add_achievement_to_student(self, student_id: int, achievement_id: int):
+        """Вызывается при каждом открытии статистики. В историю пишется только смена текущего достижения,
+        повторные получения того же достижения подряд не записываются"""
         result = await self.session.execute(
             select(StudentAchievement).where(
                 (StudentAchievement.student_id == student_id) & (StudentAchievement.achievement_id == achievement_id)
             )
         )
         existing_achievement = result.scalar_one_or_none()
-        if existing_achievement:
-            # Update timestamp for existing achievement
-            existing_achievement.created_at = datetime.now()
-            await self.session.commit()
-            return
+
+        # created_at в student_achievements - дата первого получения
+        current_achievement = await self.get_achievement_by_student_id(student_id)
+        if current_achievement is None or current_achievement.id != achievement_id:
+            self.session.add(StudentHistory(student_id=student_id, achievement_id=achievement_id))
 
         if existing_achievement is None:
             student_achievement = StudentAchievement(student_id=student_id, achievement_id=achievement_id)
             self.session.add(student_achievement)
-            await self.session.commit()
 
-    async def get_list_of_achievements_received(self) -> Sequence[Row]:
-        """Get descending list of achievements received"""
-        # Step 1: Get the unique achievement titles, pictures and ids
-        achievement_subquery = (
-            select(AchievementDB.title, AchievementDB.picture, AchievementDB.id).distinct().subquery()
+            # Счётчик для /results и роллап для аналитики обновляются в той же транзакции
+            statement = insert(AchievementCounter).values(achievement_id=achievement_id, receive_count=1)
+            statement = statement.on_conflict_do_update(
+                index_elements=["achievement_id"],
+                set_={"receive_count": AchievementCounter.receive_count + 1},
+            )
+            await self.session.execute(statement)
+            await add_achievement_rollup(self.session, student_id, achievement_id)
+
+        await self.session.commit()
+
+    async def get_student_history(
+        self, student_id: int, since: datetime | None = None, until: datetime | None = None
+    ) -> Sequence[Row]:
+        """История студента за период одним запросом по индексу (student_id, created_at, id)"""
+        statement = (
+            select(
+                StudentHistory.created_at,
+                StudentHistory.stats_delta,
+                StudentHistory.achievement_id,
+                AchievementDB.title,
+                AchievementDB.picture,
+            )
+            .outerjoin(AchievementDB, AchievementDB.id == StudentHistory.achievement_id)
+            .where(StudentHistory.student_id == student_id)
+            .order_by(StudentHistory.created_at, StudentHistory.id)
         )
+        if since:
+            statement = statement.where(StudentHistory.created_at >= since)
+        if until:
+            statement = statement.where(StudentHistory.created_at < until)
 
-        # Step 2: Count occurrences in student_achievements based on achievement ID
+        result = await self.session.execute(statement)
+        return result.all()
+
+    async def get_list_of_achievements_received(self) -> Sequence[Row]:
+        """Get descending list of achievements received"""
+        # Счётчики уже посчитаны по каждому достижению, остаётся сложить их по названию и картинке
         statement = (
             select(
-                achievement_subquery.c.title,
-                achievement_subquery.c.picture,
-                func.count(StudentAchievement.student_id).label("receive_count"),
+                AchievementDB.title,
+                AchievementDB.picture,
+                func.sum(AchievementCounter.receive_count).label("receive_count"),
             )
-            .select_from(achievement_subquery)
-            .join(StudentAchievement, StudentAchievement.achievement_id == achievement_subquery.c.id)
-            .group_by(achievement_subquery.c.title, achievement_subquery.c.picture)
-            .order_by(func.count(StudentAchievement.student_id).desc())
+            .join(AchievementCounter, AchievementCounter.achievement_id == AchievementDB.id)
+            .group_by(AchievementDB.title, AchievementDB.picture)
+            .order_by(func.sum(AchievementCounter.receive_count).desc())
         )
 
         result = await self.session.execute(statement)
@@ -152,7 +230,7 @@ class StudentDBHandler:
             return None
 
         try:
-            db_student.meme_stats = json.dumps(memes, ensure_ascii=False)
+            db_student.meme_stats = memes
             await self.session.commit()
             await self.session.refresh(db_student)
             return db_student
@@ -0,0 +1,50 @@
+from loguru import logger
+from sqlalchemy import Table, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+UPSERT_CHUNK_SIZE = 1000
+
+
+def get_upsert_statement(table: Table, rows: list[dict]):
+    """INSERT ... ON CONFLICT (id) DO UPDATE только для изменившихся строк. Возвращает признак вставки"""
+    statement = insert(table).values(rows)
+    columns = [name for name in rows[0] if name != "id"]
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={name: statement.excluded[name] for name in columns},
+        where=or_(*(table.c[name].is_distinct_from(statement.excluded[name]) for name in columns)),
+    ).returning(literal_column("xmax = 0"))
+
+
+def count_upserted(results: dict, total: int, inserted_flags: list[bool]) -> None:
+    created = sum(inserted_flags)
+    results["created"] += created
+    results["updated"] += len(inserted_flags) - created
+    results["unchanged"] += total - len(inserted_flags)
+
+
+async def upsert_batch(session: AsyncSession, table: Table, rows: list[dict], results: dict) -> dict:
+    """Сохраняет строки одной транзакцией. Если пакет целиком не прошёл, повторяет построчно в savepoint-ах"""
+    try:
+        async with session.begin_nested():
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+                inserted_flags = (await session.execute(get_upsert_statement(table, chunk))).scalars().all()
+                count_upserted(results, len(chunk), inserted_flags)
+    except SQLAlchemyError as e:
+        logger.warning(f"Batch upsert into {table.name} failed, retrying row by row: {e}")
+        results.update(created=0, updated=0, unchanged=0)
+
+        for row in rows:
+            try:
+                async with session.begin_nested():
+                    inserted_flags = (await session.execute(get_upsert_statement(table, [row]))).scalars().all()
+                count_upserted(results, 1, inserted_flags)
+            except SQLAlchemyError as e:
+                logger.error(f"Failed to upsert {table.name} row {row['id']}: {e}")
+                results["failed"] += 1
+
+    await session.commit()
+    return results
@@ -3,6 +3,8 @@ from loguru import logger
 
 from src.achievements import AchievementFactory, achievements_collection
 from src.classes.data_cache import DataCache
+from src.classes.leaderboard_cache import LeaderboardCache
+from src.classes.quiz_cache import QuizCache
 from src.classes.s3 import S3Client
 from src.classes.sheet_loader import SheetLoader
 from src.classes.sheet_pusher import SheetPusher
@@ -27,6 +29,12 @@ sheet_pusher = SheetPusher(gclient, settings.SHEET_URL_DATA)
 # Mock data cache
 data_cache = DataCache()
 
+# Achievements leaderboard cache
+leaderboard_cache = LeaderboardCache()
+
+# Rendered meme quiz questions cache
+quiz_cache = QuizCache()
+
 # Statistics loader from API
 stats_loader = StatsLoader(settings.LOAD_STATS_HOST, settings.LOAD_STATS_TOKEN)
 
@@ -42,10 +50,8 @@ s3_client = S3Client(
 def load_cache():
     logger.info("Loading mock data cache...")
     mock_data_loader.get_spreadsheet()
-    data_cache.update_stats(mock_data_loader.get_data_from_sheet("mock"))
-    data_cache.update_courses(mock_data_loader.get_data_from_sheet("courses"))
-    data_cache.update_skills_details(mock_data_loader.get_data_from_sheet("skills_detailed"))
-    data_cache.update_professions_info(mock_data_loader.get_data_from_sheet("professions"))
+    for sheet_name in ("mock", "courses", "skills_detailed", "professions"):
+        data_cache.update_sheet(sheet_name, mock_data_loader.get_data_from_sheet(sheet_name))
     logger.info("Data cache has been loaded!")
 
     # data_cache.update_skills(mock_data_loader.get_data_from_sheet("skills"))  # DEPRECATED
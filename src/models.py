@@ -80,6 +80,12 @@ class ProfessionEnumWithAll(str, Enum):
     ALL = "ALL"
 
 
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    GZIP = "csv.gz"
+    PARQUET = "parquet"
+
+
 class Achievement(BaseModel):
     title: str
     description: str
@@ -213,6 +219,9 @@ class DateQuery(BaseModel):
     search_date: date | None = Field(
         None, validation_alias="date", description="Date for which to fetch login data (YYYY-MM-DD)"
     )
+    end_date: date | None = Field(
+        None, description="Last date of the range, inclusive (YYYY-MM-DD). If not set, only the date is exported"
+    )
 
     @field_validator("search_date")
     @classmethod
@@ -226,6 +235,16 @@ class DateQuery(BaseModel):
         except ValueError:
             return datetime.now().date()
 
+    @property
+    def last_date(self) -> date:
+        return self.end_date or self.search_date
+
+    @property
+    def is_reversed(self) -> bool:
+        return self.last_date < self.search_date
+
     @property
     def formatted_date(self) -> str:
+        if self.last_date != self.search_date:
+            return f"{self.search_date.strftime('%Y-%m-%d')}_{self.last_date.strftime('%Y-%m-%d')}"
         return self.search_date.strftime("%Y-%m-%d")
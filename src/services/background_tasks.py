@@ -1,9 +1,28 @@
 import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
 
 from loguru import logger
 
 from src.classes.data_cache import DataCache
 from src.classes.sheet_loader import AsyncSheetLoaderWrapper, SheetLoader
+from src.db.challenges_crud import ChallengeDBHandler
+from src.db.session import async_session_maker
+from src.db.students_crud import StudentDBHandler
+from src.services.challenges_queue import get_next_student_id
+
+# Интервалы обновления листов Google Sheets, в секундах
+SHEETS_REFRESH_INTERVALS = {
+    "memes": 60 * 60,
+    "skills_detailed": 60 * 60,
+    "professions": 6 * 60 * 60,
+    "courses": 6 * 60 * 60,
+    "mock": 6 * 60 * 60,
+}
+SCHEDULER_TICK = 60
+MAX_STORED_RELOAD_JOBS = 20
 
 
 async def get_data_from_sheet(data_loader: SheetLoader, sheet_name: str) -> list:
@@ -12,21 +31,145 @@ async def get_data_from_sheet(data_loader: SheetLoader, sheet_name: str) -> list
     return await async_sheet_loader.get_data_from_sheet(sheet_name)
 
 
-async def update_meme_data_periodically(
+async def reload_sheets(
     data_loader: SheetLoader,
     data_cache: DataCache,
+    sheet_names: list[str],
+    force: bool = False,
+) -> dict[str, bool]:
+    """Перезагружает указанные листы по запросу. Возвращает, какие из них изменились"""
+    async_sheet_loader = AsyncSheetLoaderWrapper(data_loader)
+    await async_sheet_loader.get_spreadsheet()
+
+    results = {}
+    for sheet_name in sheet_names:
+        data = await async_sheet_loader.get_data_from_sheet(sheet_name)
+        if not data:
+            raise ValueError(f"Sheet {sheet_name} returned no data")
+        results[sheet_name] = data_cache.update_sheet(sheet_name, data, force=force)
+        logger.info(f"Sheet {sheet_name} reloaded on demand, changed: {results[sheet_name]}")
+
+    return results
+
+
+@dataclass
+class ReloadJob:
+    sheet_names: list[str]
+    force: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: datetime = field(default_factory=datetime.now)
+    status: str = "running"  # running, done, failed
+    version: int | None = None
+    sheets: dict[str, dict] = field(default_factory=dict)
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "status": self.status,
+            "version": self.version,
+            "sheets": self.sheets,
+            "error": self.error,
+        }
+
+
+reload_jobs: dict[str, ReloadJob] = {}
+_running_tasks: set[asyncio.Task] = set()
+
+
+async def run_reload_job(job: ReloadJob, data_loader: SheetLoader, data_cache: DataCache) -> None:
+    try:
+        changed = await reload_sheets(data_loader, data_cache, job.sheet_names, force=job.force)
+    except Exception as e:
+        logger.error(f"Sheets reload job {job.id} failed: {e}")
+        job.status, job.error = "failed", str(e)
+        return
+
+    snapshot = data_cache.snapshot
+    row_counts = snapshot.row_counts()
+    job.version = snapshot.version
+    job.sheets = {
+        sheet_name: {
+            "changed": changed[sheet_name],
+            "version": snapshot.sheet_version(sheet_name),
+            "rows": row_counts[sheet_name],
+        }
+        for sheet_name in job.sheet_names
+    }
+    job.status = "done"
+
+
+def start_reload_job(data_loader: SheetLoader, data_cache: DataCache, sheet_names: list[str], force: bool) -> ReloadJob:
+    """Перезагрузка листов в фоне: запрос не ждёт Google Sheets, результат - по id задачи"""
+    job = ReloadJob(sheet_names=sheet_names, force=force)
+
+    reload_jobs[job.id] = job
+    for job_id in list(reload_jobs)[:-MAX_STORED_RELOAD_JOBS]:
+        del reload_jobs[job_id]
+
+    task = asyncio.create_task(run_reload_job(job, data_loader, data_cache))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return job
+
+
+async def refresh_sheets_periodically(
+    data_loader: SheetLoader,
+    data_cache: DataCache,
+    intervals: dict[str, int] = SHEETS_REFRESH_INTERVALS,
 ) -> None:
+    async_sheet_loader = AsyncSheetLoaderWrapper(data_loader)
+    loaded_sheets = data_cache.loaded_sheets
+    now = time.monotonic()
+
+    # Листы, не загруженные при старте, обновляем сразу
+    next_refresh = {
+        sheet_name: now + interval if sheet_name in loaded_sheets else now for sheet_name, interval in intervals.items()
+    }
+    checks, skipped = 0, 0
+
     while True:
-        try:
-            logger.info("Updating meme data from Google Sheet...")
-            meme_data = await get_data_from_sheet(data_loader, "memes")
-            data_cache.update_meme_data(meme_data)
+        now = time.monotonic()
+        due_sheets = [sheet_name for sheet_name, refresh_at in next_refresh.items() if refresh_at <= now]
 
-            for key, value in data_cache.meme_data.items():
-                logger.info(f"Options for {key}: {len(value.options)}")
+        if due_sheets:
+            await async_sheet_loader.get_spreadsheet()
 
-            logger.info("Meme's data updated.")
-        except Exception as e:
-            logger.error(f"Error during meme's data update: {e}")
+        for sheet_name in due_sheets:
+            next_refresh[sheet_name] = now + intervals[sheet_name]
+            started = time.perf_counter()
+
+            try:
+                data = await async_sheet_loader.get_data_from_sheet(sheet_name)
+                if not data:
+                    logger.warning(f"Sheet {sheet_name} returned no data, keeping cached version")
+                    continue
+                changed = data_cache.update_sheet(sheet_name, data)
+            except Exception as e:
+                logger.error(f"Error during {sheet_name} data update: {e}")
+                continue
+
+            checks += 1
+            skipped += not changed
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logger.info(
+                f"Sheet {sheet_name} {'updated' if changed else 'unchanged'} in {elapsed_ms:.0f} ms, "
+                f"data version {data_cache.version}, skip rate {skipped}/{checks} ({skipped / checks:.0%})"
+            )
+
+        await asyncio.sleep(SCHEDULER_TICK)
 
-        await asyncio.sleep(60 * 60)  # 60 minutes
+
+async def process_challenges_queue() -> None:
+    """Пересчитывает челленджи студентов, у которых изменилась статистика"""
+    while True:
+        student_id = await get_next_student_id()
+        try:
+            async with async_session_maker() as session:
+                student = await StudentDBHandler(session).get_student_with_challenges(student_id)
+                if student:
+                    completed_challenges = [challenge.challenge for challenge in student.student_challenges]
+                    await ChallengeDBHandler(session).update_student_challenges(student, completed_challenges)
+        except Exception as e:
+            logger.error(f"Error during challenges update for student {student_id}: {e}")
@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from loguru import logger
+
+from src.classes.badges_cache import BadgeRecord
+from src.services.images import get_badge_card
+
+BADGE_ORIENTATIONS = ("vk_badge", "tg_badge")
+RENDER_CONCURRENCY = 4
+MAX_STORED_JOBS = 20
+
+
+@dataclass
+class RenderJob:
+    total: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: datetime = field(default_factory=datetime.now)
+    rendered: int = 0
+    failed: int = 0
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.rendered - self.failed
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "total": self.total,
+            "rendered": self.rendered,
+            "pending": self.pending,
+            "failed": self.failed,
+        }
+
+
+render_jobs: dict[str, RenderJob] = {}
+_running_tasks: set[asyncio.Task] = set()
+
+
+async def render_badge_cards(job: RenderJob, badges: list[BadgeRecord]) -> None:
+    """Генерирует карточки для каждого типа бейджа во всех ориентациях"""
+    semaphore = asyncio.Semaphore(RENDER_CONCURRENCY)
+
+    async def render(badge: BadgeRecord, orientation: str) -> None:
+        async with semaphore:
+            try:
+                image_data = await get_badge_card(badge, orientation)
+            except Exception as e:
+                logger.error(f"Failed to render {orientation} card for badge type {badge.badge_type}: {e}")
+                image_data = None
+
+        if image_data:
+            job.rendered += 1
+        else:
+            job.failed += 1
+
+    await asyncio.gather(*(render(badge, orientation) for badge in badges for orientation in BADGE_ORIENTATIONS))
+    logger.info(f"Badge cards render job {job.id} finished: {job.to_dict()}")
+
+
+def start_render_job(badges: list[BadgeRecord]) -> RenderJob:
+    job = RenderJob(total=len(badges) * len(BADGE_ORIENTATIONS))
+
+    render_jobs[job.id] = job
+    for job_id in list(render_jobs)[:-MAX_STORED_JOBS]:
+        del render_jobs[job_id]
+
+    task = asyncio.create_task(render_badge_cards(job, badges))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return job
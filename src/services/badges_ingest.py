@@ -0,0 +1,100 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator
+
+from fastapi.requests import Request
+from pydantic import ValidationError
+
+from src.models import Badge
+
+
+class BadgeBodyError(ValueError):
+    """Тело запроса нельзя разобрать: загрузка прерывается, таблица бейджей не меняется"""
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Разбивает поток байтов на строки, не загружая тело запроса целиком"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in stream:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def iter_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    line_number = 0
+    async for line in iter_lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BadgeBodyError(f"Invalid JSON on line {line_number}: {e.msg}") from e
+        if not isinstance(item, dict):
+            raise BadgeBodyError(f"Line {line_number} is not a JSON object")
+        yield item
+
+
+async def iter_csv(stream: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    headers = None
+    pending = ""
+    async for line in iter_lines(stream):
+        pending += line
+        # Значение в кавычках может содержать перевод строки
+        if pending.count('"') % 2:
+            continue
+
+        row = next(csv.reader([pending]), [])
+        pending = ""
+        if not row:
+            continue
+        if headers is None:
+            headers = row
+            continue
+        yield dict(zip(headers, row, strict=False))
+
+
+async def iter_json_list(request: Request) -> AsyncIterator[dict]:
+    try:
+        items = json.loads(await request.body())
+    except json.JSONDecodeError as e:
+        raise BadgeBodyError(f"Invalid JSON on line {e.lineno}: {e.msg}") from e
+    if not isinstance(items, list):
+        raise BadgeBodyError("Expected a JSON list of badges")
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise BadgeBodyError(f"Item {index} is not a JSON object")
+        yield item
+
+
+async def iter_badges(request: Request) -> AsyncIterator[Badge]:
+    """Читает бейджи из тела запроса в формате NDJSON, CSV или JSON-списка.
+    Невалидный бейдж прерывает загрузку: иначе замена таблицы молча удалила бы его из badges"""
+    content_type = request.headers.get("Content-Type", "")
+
+    if "ndjson" in content_type:
+        items = iter_ndjson(request.stream())
+    elif "csv" in content_type:
+        items = iter_csv(request.stream())
+    else:
+        items = iter_json_list(request)
+
+    index = 0
+    async for item in items:
+        try:
+            badge = Badge(**item)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            raise BadgeBodyError(f"Invalid badge {index} (id {item.get('id')}): {errors}") from e
+        index += 1
+        yield badge
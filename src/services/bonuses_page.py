@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.challenges_cache import challenges_cache
+from src.models import Student
+
+# Обновление студента и все данные страницы бонусов, кроме доступных челленджей, за один запрос.
+# Доступные челленджи - активные челленджи профессии из challenges_cache без выполненных.
+# CTE видят снимок до обновления, поэтому профессию берём из RETURNING, а старую статистику - из previous.
+# Изменившиеся ключи статистики записываются в историю студента тем же запросом
+BONUSES_PAGE_STATEMENT = text(
+    """
+    WITH student AS (
+        UPDATE students SET
+            first_name = :first_name,
+            last_name = :last_name,
+            profession = CAST(:profession AS professionenum),
+            statistics = :statistics,
+            bonuses_last_visited = :visited_at,
+            updated_at = LOCALTIMESTAMP
+        FROM students AS previous
+        WHERE students.id = :student_id AND previous.id = students.id
+        RETURNING students.id, students.first_name, students.last_name, students.profession, students.points,
+            previous.statistics IS DISTINCT FROM students.statistics AS statistics_changed,
+            previous.statistics AS previous_statistics, students.statistics
+    ),
+    history AS (
+        -- То же, что get_stats_delta: новые значения изменившихся ключей, удалённый ключ - null
+        INSERT INTO student_history (student_id, stats_delta, created_at)
+        SELECT student.id, delta.stats_delta, LOCALTIMESTAMP
+        FROM student, LATERAL (
+            SELECT jsonb_object_agg(key, current_values.value) AS stats_delta
+            FROM jsonb_each(student.previous_statistics) AS previous_values
+                FULL JOIN jsonb_each(student.statistics) AS current_values USING (key)
+            WHERE previous_values.value IS DISTINCT FROM current_values.value
+        ) AS delta
+        WHERE student.statistics_changed
+    ),
+    completed AS (
+        SELECT challenges.id, challenges.title, challenges.value
+        FROM student_challenges JOIN challenges ON challenges.id = student_challenges.challenge_id
+        WHERE student_challenges.student_id = :student_id
+    ),
+    purchases AS (
+        SELECT products.id, products.title, products.value, student_products.created_at
+        FROM student_products JOIN products ON products.id = student_products.product_id
+        WHERE student_products.student_id = :student_id
+    ),
+    products AS (
+        SELECT products.id, products.title, products.description, products.value
+        FROM products
+        WHERE products.is_active AND products.id NOT IN (SELECT id FROM purchases)
+    )
+    SELECT
+        student.id, student.first_name, student.last_name, student.profession, student.points,
+        student.statistics_changed,
+        (SELECT COALESCE(json_agg(json_build_array(id, title, value)), '[]') FROM completed) AS completed,
+        (SELECT COALESCE(json_agg(json_build_array(id, title, description, value)), '[]') FROM products) AS products,
+        (
+            SELECT COALESCE(json_agg(json_build_array(id, title, value, created_at) ORDER BY created_at), '[]')
+            FROM purchases
+        ) AS purchases
+    FROM student
+    """
+).bindparams(bindparam("statistics", type_=JSONB))
+
+
+class PageChallenge(NamedTuple):
+    id: str
+    title: str
+    value: int
+
+
+class PageProduct(NamedTuple):
+    id: str
+    title: str
+    description: str | None
+    value: int
+
+
+class PagePurchase(NamedTuple):
+    product_id: str
+    title: str
+    value: int
+    created_at: datetime
+
+
+@dataclass(frozen=True, slots=True)
+class BonusesPage:
+    """Данные страницы бонусов студента"""
+
+    student_id: int
+    first_name: str | None
+    last_name: str | None
+    points: int
+    statistics_changed: bool
+    completed_challenges: list[PageChallenge]
+    available_challenges: list[PageChallenge]
+    available_products: list[PageProduct]
+    purchases: list[PagePurchase]
+
+    @property
+    def fullname(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+
+def get_page_params(student: Student) -> dict:
+    return {
+        "student_id": student.id,
+        "first_name": student.first_name,
+        "last_name": student.last_name,
+        "profession": student.profession.name,
+        "statistics": student.statistics,
+        "visited_at": datetime.now(),
+    }
+
+
+async def get_bonuses_page(session: AsyncSession, student: Student) -> BonusesPage | None:
+    """Обновляет студента свежей статистикой и собирает страницу бонусов. None - студента нет в БД"""
+    row = (await session.execute(BONUSES_PAGE_STATEMENT, get_page_params(student))).one_or_none()
+    await session.commit()
+
+    if row is None:
+        return None
+
+    completed_challenges = [PageChallenge(*item) for item in row.completed]
+    completed_ids = {challenge.id for challenge in completed_challenges}
+    active_challenges = await challenges_cache.get_active(session, student.profession.name)
+
+    return BonusesPage(
+        student_id=row.id,
+        first_name=row.first_name,
+        last_name=row.last_name,
+        points=row.points,
+        statistics_changed=row.statistics_changed,
+        completed_challenges=completed_challenges,
+        available_challenges=[
+            PageChallenge(challenge.id, challenge.title, challenge.value)
+            for challenge in active_challenges
+            if challenge.id not in completed_ids
+        ],
+        available_products=[PageProduct(*item) for item in row.products],
+        purchases=[
+            PagePurchase(product_id, title, value, datetime.fromisoformat(created_at))
+            for product_id, title, value, created_at in row.purchases
+        ],
+    )
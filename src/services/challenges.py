@@ -4,34 +4,30 @@ from fastapi import HTTPException
 from loguru import logger
 
 from src.bot.logger import tg_logger
-from src.db.challenges_crud import ChallengeDBHandler
 from src.db.students_crud import StudentDBHandler
+from src.services.bonuses_page import BonusesPage, get_bonuses_page
+from src.services.challenges_queue import enqueue_challenges_update
 from src.web.handlers import StudentHandler
 
 
 async def get_or_create_student(
-    student_id: int, handler: StudentHandler, students_crud: StudentDBHandler, challenges_crud: ChallengeDBHandler
-) -> tuple:
+    student_id: int, handler: StudentHandler, students_crud: StudentDBHandler
+) -> BonusesPage:
     if not handler.student:
         logger.info(f"Statistics for student {student_id} not found")
         await tg_logger.log("ERROR", f"Endpoint: /bonuses/{student_id}\nStudent with id {student_id} not found!")
         raise HTTPException(status_code=404, detail="Страница не найдена")
 
-    student = await students_crud.get_student_with_challenges(student_id)
+    page = await get_bonuses_page(students_crud.session, handler.student)
 
-    if not student:
+    if not page:
         handler.student.bonuses_last_visited = datetime.now()
-        student = await students_crud.create_student(handler.student)
-        completed_challenges = []
-
-        if not student:
+        if not await students_crud.create_student(handler.student):
             raise HTTPException(status_code=500, detail="Failed to create a new student in DB")
-    else:
-        completed_challenges = [student_challenge.challenge for student_challenge in student.student_challenges]
-        student = await students_crud.update_student(handler.student, bonuses_visited=True)
+        page = await get_bonuses_page(students_crud.session, handler.student)
 
-    available_challenges, student_challenges = await challenges_crud.update_student_challenges(
-        student, completed_challenges
-    )
+    # Челленджи пересчитываются в фоне при изменении статистики, здесь только читаем результат
+    elif page.statistics_changed:
+        enqueue_challenges_update(student_id)
 
-    return student, available_challenges, student_challenges
+    return page
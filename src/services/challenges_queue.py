@@ -0,0 +1,30 @@
+import asyncio
+
+from loguru import logger
+
+QUEUE_MAX_SIZE = 1000
+
+# Студенты, чья статистика изменилась и чьи челленджи нужно пересчитать
+challenges_queue: asyncio.Queue[int] = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+_queued_ids: set[int] = set()
+
+
+def enqueue_challenges_update(student_id: int) -> bool:
+    """Ставит пересчёт челленджей студента в очередь. Повторно один и тот же студент не добавляется"""
+    if student_id in _queued_ids:
+        return True
+
+    try:
+        challenges_queue.put_nowait(student_id)
+    except asyncio.QueueFull:
+        logger.warning(f"Challenges queue is full, skipping update for student {student_id}")
+        return False
+
+    _queued_ids.add(student_id)
+    return True
+
+
+async def get_next_student_id() -> int:
+    student_id = await challenges_queue.get()
+    _queued_ids.discard(student_id)
+    return student_id
@@ -0,0 +1,160 @@
+import time
+from collections import defaultdict
+from types import CodeType
+from typing import NamedTuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlmodel import select
+
+from src.db.analytics_crud import add_challenge_rollups
+from src.db.ledger import add_earned_points
+from src.db.models import ChallengesDB, StudentChallenge, StudentDB
+from src.db.session import async_session_maker
+from src.services.condition_masks import ConditionMask, StatsColumns, compile_mask
+from src.services.safe_eval import compile_condition, run_condition
+
+student_challenges_table = StudentChallenge.__table__
+
+
+class CompiledChallenge(NamedTuple):
+    id: str
+    profession: str
+    value: int
+    code: CodeType
+    mask: ConditionMask | None  # None - условие считается построчно
+
+
+async def get_compiled_challenges(
+    session: AsyncSession, challenge_ids: list[str] | None = None
+) -> list[CompiledChallenge]:
+    query = select(ChallengesDB).where(ChallengesDB.is_active == True)  # noqa
+    if challenge_ids:
+        query = query.where(ChallengesDB.id.in_(challenge_ids))
+
+    result = await session.execute(query)
+
+    compiled = []
+    for challenge in result.scalars().all():
+        if challenge.profession is None:
+            continue
+        try:
+            code, mask = compile_condition(challenge.eval), compile_mask(challenge.eval)
+        except ValueError as e:
+            logger.error(f"Skipping challenge {challenge.id} with invalid condition: {e}")
+            continue
+        compiled.append(CompiledChallenge(challenge.id, challenge.profession.value, challenge.value, code, mask))
+    return compiled
+
+
+def evaluate_chunk(rows: list, challenges: list[CompiledChallenge], completed: set[tuple[int, str]]) -> list[dict]:
+    """Возвращает новые пары студент-челлендж, условия которых выполнены.
+
+    Числовые условия считаются маской NumPy сразу по всему чанку. Построчно считаются остальные условия
+    и строки, где у ключа из условия нет числового значения: там результат должен совпасть с Python.
+    """
+    student_ids = np.array([row[0] for row in rows])
+    professions = np.array([row[1].name for row in rows])
+    columns = StatsColumns([row[2] or {} for row in rows])
+    completed_by_challenge = defaultdict(list)
+    for student_id, challenge_id in completed:
+        completed_by_challenge[challenge_id].append(student_id)
+
+    new_completions = []
+    for challenge in challenges:
+        pending = ~np.isin(student_ids, completed_by_challenge[challenge.id])
+        if challenge.profession != "ALL":
+            pending &= professions == challenge.profession
+
+        if challenge.mask is None:
+            row_wise = pending
+        else:
+            passed, valid = columns.evaluate(challenge.mask)
+            new_completions.extend(
+                {"student_id": student_id, "challenge_id": challenge.id}
+                for student_id in student_ids[pending & passed].tolist()
+            )
+            row_wise = pending & ~valid
+
+        for index in np.flatnonzero(row_wise).tolist():
+            try:
+                if run_condition(challenge.code, rows[index][2]):
+                    new_completions.append({"student_id": rows[index][0], "challenge_id": challenge.id})
+            except ValueError:
+                continue
+    return new_completions
+
+
+async def save_completions(session: AsyncSession, new_completions: list[dict], values: dict[str, int]) -> int:
+    """Сохраняет выполненные челленджи, записывает начисления в журнал, обновляет баланс и роллапы одной транзакцией"""
+    statement = (
+        insert(student_challenges_table)
+        .on_conflict_do_nothing(index_elements=["student_id", "challenge_id"])
+        .returning(
+            student_challenges_table.c.id,
+            student_challenges_table.c.student_id,
+            student_challenges_table.c.challenge_id,
+        )
+    )
+    inserted = (await session.execute(statement, new_completions)).all()
+
+    # Баллы начисляем только за действительно вставленные строки
+    await add_earned_points(
+        session, [(student_id, challenge_id, values[challenge_id]) for _, student_id, challenge_id in inserted]
+    )
+    await add_challenge_rollups(session, [row.id for row in inserted])
+    await session.commit()
+    return len(inserted)
+
+
+async def score_all_students(
+    session_maker: async_sessionmaker = async_session_maker,
+    chunk_size: int = 1000,
+    challenge_ids: list[str] | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """Пересчитывает челленджи для всех студентов, проходя таблицу чанками по id"""
+    async with session_maker() as session:
+        challenges = await get_compiled_challenges(session, challenge_ids)
+
+    values = {challenge.id: challenge.value for challenge in challenges}
+    results = {"students": 0, "completed": 0, "seconds": 0.0}
+    started = time.perf_counter()
+    last_id = 0
+
+    while challenges:
+        async with session_maker() as session:
+            query = (
+                select(StudentDB.id, StudentDB.profession, StudentDB.statistics)
+                .where(StudentDB.id > last_id)
+                .order_by(StudentDB.id)
+                .limit(chunk_size)
+            )
+            rows = (await session.execute(query)).all()
+            if not rows:
+                break
+
+            student_ids = [row.id for row in rows]
+            query = select(StudentChallenge.student_id, StudentChallenge.challenge_id).where(
+                StudentChallenge.student_id.in_(student_ids)
+            )
+            completed = set((await session.execute(query)).all())
+
+            new_completions = evaluate_chunk(rows, challenges, completed)
+            if dry_run:
+                results["completed"] += len(new_completions)
+            elif new_completions:
+                results["completed"] += await save_completions(session, new_completions, values)
+
+        results["students"] += len(rows)
+        last_id = student_ids[-1]
+
+    results["seconds"] = round(time.perf_counter() - started, 3)
+    rate = results["students"] / results["seconds"] if results["seconds"] else 0
+    logger.info(
+        f"Scored {results['students']} students against {len(challenges)} challenges in {results['seconds']} s "
+        f"({rate:.0f} students/s), new completions: {results['completed']}{' (dry run)' if dry_run else ''}"
+    )
+    return results
@@ -0,0 +1,159 @@
+import ast
+from functools import lru_cache, reduce
+from typing import Callable, NamedTuple, Sequence
+
+import numpy as np
+
+from src.services.safe_eval import compile_condition
+
+# До 2**53 целые в float64 представлены точно, сравнения совпадают с Python. Это касается и входных значений,
+# и каждого промежуточного результата: 2**27 * 2**27 + 1 в float64 уже округляется
+MAX_EXACT_VALUE = 2**53
+
+ARITHMETIC_OPERATORS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply}
+UNARY_OPERATORS = {ast.USub: np.negative, ast.UAdd: np.positive}
+COMPARE_OPERATORS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+Columns = dict[str, np.ndarray]
+# (результат, посчитано) по строкам
+MaskResult = tuple[np.ndarray, np.ndarray]
+
+
+class ConditionMask(NamedTuple):
+    """Условие, посчитанное сразу по колонкам чанка. names - ключи статистики, которые оно читает"""
+
+    names: tuple[str, ...]
+    evaluate: Callable[[Columns], MaskResult]
+
+
+class _NotVectorizableError(Exception):
+    pass
+
+
+def _bounded(values: np.ndarray | float) -> np.ndarray:
+    # Результат вне точного диапазона - NaN, как и нечисловое значение: такие строки считаются построчно
+    return np.where(np.abs(values) < MAX_EXACT_VALUE, values, np.nan)
+
+
+def _arithmetic(node: ast.AST, names: set[str]) -> Callable[[Columns], np.ndarray | float]:
+    if isinstance(node, ast.Name):
+        names.add(node.id)
+        return lambda columns: columns[node.id]
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, int | float):
+        if abs(node.value) >= MAX_EXACT_VALUE:
+            raise _NotVectorizableError
+        value = float(node.value)
+        return lambda columns: value
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        operator, operand = UNARY_OPERATORS[type(node.op)], _arithmetic(node.operand, names)
+        return lambda columns: _bounded(operator(operand(columns)))
+
+    # Деление и остаток не векторизуем: деление на ноль в Python - ошибка, а в NumPy - inf
+    if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC_OPERATORS:
+        operator = ARITHMETIC_OPERATORS[type(node.op)]
+        left, right = _arithmetic(node.left, names), _arithmetic(node.right, names)
+        return lambda columns: _bounded(operator(left(columns), right(columns)))
+
+    raise _NotVectorizableError
+
+
+def _is_computed(values: Sequence[np.ndarray | float]) -> np.ndarray:
+    return reduce(np.logical_and, (~np.isnan(value) for value in values))
+
+
+def _boolean(node: ast.AST, names: set[str]) -> Callable[[Columns], MaskResult]:
+    # and/or/not только в логическом контексте: там bool(a or b) == bool(a) or bool(b)
+    if isinstance(node, ast.BoolOp):
+        operator = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        parts = [_boolean(value, names) for value in node.values]
+
+        def combine(columns: Columns) -> MaskResult:
+            results, computed = zip(*(part(columns) for part in parts), strict=True)
+            return reduce(operator, results), reduce(np.logical_and, computed)
+
+        return combine
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _boolean(node.operand, names)
+
+        def negate(columns: Columns) -> MaskResult:
+            result, computed = operand(columns)
+            return np.logical_not(result), computed
+
+        return negate
+
+    if isinstance(node, ast.Compare):
+        if not all(type(op) in COMPARE_OPERATORS for op in node.ops):
+            raise _NotVectorizableError
+        operands = [_arithmetic(operand, names) for operand in (node.left, *node.comparators)]
+        operators = [COMPARE_OPERATORS[type(op)] for op in node.ops]
+
+        def compare(columns: Columns) -> MaskResult:
+            values = [operand(columns) for operand in operands]
+            result = reduce(
+                np.logical_and, (operator(values[i], values[i + 1]) for i, operator in enumerate(operators))
+            )
+            return result, _is_computed(values)
+
+        return compare
+
+    value = _arithmetic(node, names)
+
+    def is_true(columns: Columns) -> MaskResult:
+        values = value(columns)
+        return np.not_equal(values, 0), _is_computed([values])
+
+    return is_true
+
+
+@lru_cache(maxsize=1024)
+def compile_mask(condition: str) -> ConditionMask | None:
+    """Векторная версия условия или None, если условие нельзя посчитать по числовым колонкам"""
+    compile_condition(condition)  # тот же белый список, что и при построчном вычислении
+    tree = ast.parse(condition.strip(), mode="eval")
+
+    names: set[str] = set()
+    try:
+        evaluate = _boolean(tree.body, names)
+    except _NotVectorizableError:
+        return None
+    return ConditionMask(tuple(sorted(names)), evaluate)
+
+
+class StatsColumns:
+    """Статистика чанка студентов по колонкам. Колонка строится при первом обращении к ключу"""
+
+    def __init__(self, stats: Sequence[dict]):
+        self._stats = stats
+        self._columns: Columns = {}
+
+    def _build(self, name: str) -> None:
+        self._columns[name] = np.fromiter(
+            (
+                value if isinstance(value := row.get(name), int | float) and abs(value) < MAX_EXACT_VALUE else np.nan
+                for row in self._stats
+            ),
+            dtype=np.float64,
+            count=len(self._stats),
+        )
+
+    def evaluate(self, mask: ConditionMask) -> MaskResult:
+        """(результат, посчитано) по строкам. Не посчитаны строки, где значение ключа не числовое
+        или какой-то промежуточный результат вышел за MAX_EXACT_VALUE"""
+        for name in mask.names:
+            if name not in self._columns:
+                self._build(name)
+
+        with np.errstate(invalid="ignore", over="ignore"):
+            result, computed = mask.evaluate(self._columns)
+        valid = np.broadcast_to(computed, len(self._stats))
+        return np.broadcast_to(result, valid.shape) & valid, valid
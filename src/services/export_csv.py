@@ -1,42 +1,104 @@
+import base64
 import codecs
 import csv
+import zlib
+from datetime import datetime, timedelta
 from io import StringIO
-from typing import Sequence
+from typing import AsyncIterator, Callable, Sequence
 
-from sqlalchemy import Row
+from sqlalchemy import Row, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db.models import StudentProduct
+from src.db.export_window import ExportKey, get_export_until
+from src.db.models import StudentDB, StudentProduct
+from src.db.session import async_session_maker
+from src.models import ExportFormat
+from src.services.export_parquet import generate_parquet
 
+# Окно дельта-выгрузки закрывается с отставанием: транзакции, начатые раньше границы,
+# успевают зафиксироваться и не теряются между выгрузками
+EXPORT_CURSOR_LAG = timedelta(minutes=1)
 
-def generate_csv(data: Sequence[Row] | list[StudentProduct], type_: str) -> StringIO:
+CSV_HEADERS = {
+    "last_login": ["student_id", "last_login"],
+    "adoption": ["student_id", "bonuses_last_visited", "completed_challenges", "purchased_products"],
+    "purchases": ["student_id", "product_id", "created_at", "added_by"],
+}
+
+# Ключ (время изменения, id), по которому строится окно дельта-выгрузки
+EXPORT_KEY_COLUMNS = {
+    "adoption": (StudentDB.updated_at, StudentDB.id),
+    "purchases": (StudentProduct.created_at, StudentProduct.id),
+}
+
+
+def encode_cursor(key: ExportKey) -> str:
+    return base64.urlsafe_b64encode(f"{key.ts.isoformat()}|{key.id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> ExportKey:
+    try:
+        ts, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return ExportKey(datetime.fromisoformat(ts), int(id_))
+    except ValueError as e:
+        raise ValueError(f"Invalid export cursor: {cursor}") from e
+
+
+async def get_export_window(type_: str, cursor: str | None) -> tuple[ExportKey | None, ExportKey, str]:
+    """(since, until, следующий курсор). Окно закрывается последней строкой до отметки по часам БД
+    и в полной выгрузке (без курсора), и в дельте. Курсор из ответа - начало следующего окна"""
+    since = decode_cursor(cursor) if cursor else None
+    async with async_session_maker() as session:
+        watermark = (await session.execute(select(func.localtimestamp() - EXPORT_CURSOR_LAG))).scalar_one()
+        until = await get_export_until(session, *EXPORT_KEY_COLUMNS[type_], watermark, since)
+    return since, until, encode_cursor(until)
+
+
+async def generate_csv(partitions: AsyncIterator[Sequence[Row]], type_: str) -> AsyncIterator[bytes]:
+    """Кодирует строки в CSV по мере их получения: в памяти не больше одного куска"""
     buffer = StringIO()
-    buffer.write(codecs.BOM_UTF8.decode("utf-8"))
     writer = csv.writer(buffer)
 
-    if not data:
-        return buffer
-
-    match type_:
-        case "last_login":
-            writer.writerow(["student_id", "last_login"])
-            for student in data:
-                writer.writerow([student.id, student.last_login])
-        case "adoption":
-            writer.writerow(
-                [
-                    "student_id",
-                    "bonuses_last_visited",
-                    "completed_challenges",
-                    "purchased_products",
-                ]
-            )
-            for student in data:
-                writer.writerow(
-                    [student.id, student.bonuses_last_visited, student.completed_challenges, student.purchased_products]
-                )
-        case "purchases":
-            writer.writerow(["student_id", "product_id", "created_at", "added_by"])
-            for purchase in data:
-                writer.writerow([purchase.student_id, purchase.product_id, purchase.created_at, purchase.added_by])
-
-    return buffer
+    yield codecs.BOM_UTF8
+    writer.writerow(CSV_HEADERS[type_])
+
+    async for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def generate_gzip_csv(partitions: AsyncIterator[Sequence[Row]], type_: str) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 31 - формат gzip
+    async for chunk in generate_csv(partitions, type_):
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+EXPORT_GENERATORS = {
+    ExportFormat.CSV: generate_csv,
+    ExportFormat.GZIP: generate_gzip_csv,
+    ExportFormat.PARQUET: generate_parquet,
+}
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv; charset=utf-8-sig",
+    ExportFormat.GZIP: "application/gzip",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+async def stream_export(
+    type_: str,
+    get_partitions: Callable[[AsyncSession], AsyncIterator[Sequence[Row]]],
+    export_format: ExportFormat = ExportFormat.CSV,
+) -> AsyncIterator[bytes]:
+    """Своя сессия на время отдачи ответа: сессия из Depends закрывается раньше, чем StreamingResponse дочитает"""
+    async with async_session_maker() as session:
+        async for chunk in EXPORT_GENERATORS[export_format](get_partitions(session), type_):
+            yield chunk
@@ -0,0 +1,64 @@
+from typing import AsyncIterator, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Row
+
+PARQUET_SCHEMAS = {
+    "last_login": pa.schema([("student_id", pa.int64()), ("last_login", pa.timestamp("us"))]),
+    "adoption": pa.schema(
+        [
+            ("student_id", pa.int64()),
+            ("bonuses_last_visited", pa.timestamp("us")),
+            ("completed_challenges", pa.int64()),
+            ("purchased_products", pa.int64()),
+        ]
+    ),
+    "purchases": pa.schema(
+        [
+            ("student_id", pa.int64()),
+            ("product_id", pa.string()),
+            ("created_at", pa.timestamp("us")),
+            ("added_by", pa.string()),
+        ]
+    ),
+}
+
+
+class ChunkSink:
+    """Файлоподобный приёмник для ParquetWriter: накопленные байты забираются после каждой группы строк"""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def generate_parquet(partitions: AsyncIterator[Sequence[Row]], type_: str) -> AsyncIterator[bytes]:
+    """Каждая пачка строк из курсора становится колоночным батчем и группой строк Parquet (zstd)"""
+    schema = PARQUET_SCHEMAS[type_]
+    sink = ChunkSink()
+
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        async for rows in partitions:
+            columns = zip(*rows, strict=True)
+            arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema, strict=True)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            if data := sink.take():
+                yield data
+
+    yield sink.take()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from src.db.models import IdempotencyKeyDB
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+
+def get_request_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_saved_response(saved: IdempotencyKeyDB, request_hash: str) -> JSONResponse:
+    if saved.request_hash != request_hash:
+        return JSONResponse(
+            content={"status": "error", "message": f"Idempotency-Key {saved.key} уже использован для другого запроса"},
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    return JSONResponse(
+        content=json.loads(saved.response),
+        status_code=saved.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def claim_key(session: AsyncSession, key: str, request_hash: str) -> JSONResponse | None:
+    """Занимает ключ в текущей транзакции. None - ключ наш, иначе ответ на первый запрос с этим ключом.
+
+    Запрос с тем же ключом, пришедший параллельно, ждёт на уникальном индексе, пока первый не завершит транзакцию,
+    и получает его сохранённый ответ. Истёкший ключ занимается заново
+    """
+    now = datetime.now()
+    statement = insert(IdempotencyKeyDB).values(
+        key=key, request_hash=request_hash, status_code=0, response="", created_at=now
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"request_hash": request_hash, "status_code": 0, "response": "", "created_at": now},
+        where=IdempotencyKeyDB.created_at < now - IDEMPOTENCY_KEY_TTL,
+    ).returning(IdempotencyKeyDB.key)
+
+    if (await session.execute(statement)).scalar_one_or_none() is not None:
+        return None
+
+    saved = (await session.execute(select(IdempotencyKeyDB).where(IdempotencyKeyDB.key == key))).scalar_one()
+    return get_saved_response(saved, request_hash)
+
+
+async def save_response(session: AsyncSession, key: str, response: JSONResponse) -> None:
+    """Записывает ответ в занятый ключ и заодно удаляет истёкшие ключи (по индексу на created_at)"""
+    await session.execute(
+        update(IdempotencyKeyDB)
+        .where(IdempotencyKeyDB.key == key)
+        .values(status_code=response.status_code, response=response.body.decode())
+    )
+    await session.execute(
+        delete(IdempotencyKeyDB).where(IdempotencyKeyDB.created_at < datetime.now() - IDEMPOTENCY_KEY_TTL)
+    )
+
+
+async def run_idempotent(
+    session: AsyncSession, key: str | None, request_hash: str, get_response: Callable[[], Awaitable[JSONResponse]]
+) -> JSONResponse:
+    """Выполняет запрос и сохраняет его ответ по ключу одной транзакцией: ответ сохранён тогда и только тогда,
+    когда зафиксированы изменения, которые он описывает"""
+    async with session.begin():
+        if key and (saved := await claim_key(session, key, request_hash)):
+            return saved
+
+        response = await get_response()
+        if key:
+            await save_response(session, key, response)
+    return response
@@ -1,3 +1,4 @@
+import asyncio
 import re
 import textwrap
 from io import BytesIO
@@ -9,6 +10,7 @@ from fastapi import HTTPException
 from loguru import logger
 from PIL import Image, ImageDraw, ImageFont
 
+from src.classes.badges_cache import BadgeRecord, badges_cache
 from src.dependencies import s3_client
 from src.models import Achievement, Badge
 
@@ -183,48 +185,21 @@ async def check_s3_file_exists(image_name: str, params: dict) -> dict | None:
     return None
 
 
-async def open_image(path: str | Path, rgba: bool = False) -> Image.Image:
+async def open_image(path: str | Path) -> Image.Image:
+    """Читает файл асинхронно. Image.open только разбирает заголовок, пиксели декодируются при отрисовке"""
     async with aiofiles.open(path, mode="rb") as f:
         image_data = await f.read()
-        if rgba:
-            return Image.open(BytesIO(image_data)).convert("RGBA")
         return Image.open(BytesIO(image_data))
 
 
-async def upload_to_s3(image: Image.Image, image_name: str) -> str:
+async def upload_to_s3(image_bytes: bytes, image_name: str) -> str:
     """Возращает ссылку на изображение в S3"""
-    with BytesIO() as img_byte_arr:
-        image.save(img_byte_arr, format="PNG", optimize=False, compress_level=0)
-        image_bytes = img_byte_arr.getvalue()
-        return await s3_client.upload_file(image_bytes, image_name)  # Загружаем изображение в S3
-
+    return await s3_client.upload_file(image_bytes, image_name)  # Загружаем изображение в S3
 
-async def find_or_generate_image(obj: Achievement | Badge, orientation: str) -> dict | None:
-    """Ищем или генерируем изображение для данного достижения"""
-    params = get_images_params(orientation)
-    prefix = params["prefix"]
-
-    if isinstance(obj, Achievement):
-        image_name = f"{prefix}/{obj.profession}/{obj.type.value}.png"
-    else:
-        image_name = f"badges/{prefix}/{obj.badge_type}.png"
-
-    try:
-        # Проверяем, существует ли файл в S3
-        image_exist = await check_s3_file_exists(image_name, params)
-        if image_exist:
-            return image_exist
-
-        # Если нет, то генерируем его
-        base_image = await open_image(IMAGES_PATH / params["template"])
-        if isinstance(obj, Achievement):
-            logo_img = await open_image(IMAGES_PATH / f"logo_{obj.picture}", rgba=True)
-        else:
-            logo_img = await open_image(IMAGES_PATH / "badges" / f"{obj.badge_type}.png", rgba=True)
-
-    except Exception:
-        return None
 
+def render_image(obj: Achievement | Badge, params: dict, base_image: Image.Image, logo_img: Image.Image) -> bytes:
+    """Рисует карточку и возвращает PNG. Синхронная, вызывается в отдельном потоке"""
+    logo_img = logo_img.convert("RGBA")
     logo_resized = resize_image(logo_img, params["logo_height"])
     achievement_x, achievement_y = params["x_logo"], params["y_logo"]
 
@@ -275,6 +250,41 @@ async def find_or_generate_image(obj: Achievement | Badge, orientation: str) ->
         align=align_text,
     )
 
+    with BytesIO() as img_byte_arr:
+        base_image.save(img_byte_arr, format="PNG", optimize=False, compress_level=0)
+        return img_byte_arr.getvalue()
+
+
+async def find_or_generate_image(obj: Achievement | Badge, orientation: str) -> dict | None:
+    """Ищем или генерируем изображение для данного достижения"""
+    params = get_images_params(orientation)
+    prefix = params["prefix"]
+
+    if isinstance(obj, Achievement):
+        image_name = f"{prefix}/{obj.profession}/{obj.type.value}.png"
+    else:
+        image_name = f"badges/{prefix}/{obj.badge_type}.png"
+
+    try:
+        # Проверяем, существует ли файл в S3
+        image_exist = await check_s3_file_exists(image_name, params)
+        if image_exist:
+            return image_exist
+
+        # Если нет, то генерируем его
+        base_image = await open_image(IMAGES_PATH / params["template"])
+        if isinstance(obj, Achievement):
+            logo_img = await open_image(IMAGES_PATH / f"logo_{obj.picture}")
+        else:
+            logo_img = await open_image(IMAGES_PATH / "badges" / f"{obj.badge_type}.png")
+
+    except Exception:
+        return None
+
+    # Отрисовка и кодирование PNG - CPU-работа, выносим её из event loop; S3 остаётся в нём
+    image_bytes = await asyncio.to_thread(render_image, obj, params, base_image, logo_img)
+    width, height = params["size"]
+
     try:
         # if isinstance(obj, Badge):
         #     async with aiofiles.open(IMAGES_PATH / "badges" / f"saved_{obj.badge_type}.png", mode="wb") as f:
@@ -284,12 +294,22 @@ async def find_or_generate_image(obj: Achievement | Badge, orientation: str) ->
         #             await f.write(image_bytes)
         #     return {"url": f"badges/saved_{obj.badge_type}.png", "width": width, "height": height}
 
-        url = await upload_to_s3(base_image, image_name)
+        url = await upload_to_s3(image_bytes, image_name)
         return {"url": url, "width": width, "height": height}
     except Exception:
         return None
 
 
+async def get_badge_card(badge: BadgeRecord, orientation: str) -> dict | None:
+    """Карточка бейджа из кэша, при промахе ищем в S3 или генерируем"""
+    image_data = badges_cache.get_card(badge.badge_type, orientation)
+    if image_data is None:
+        image_data = await find_or_generate_image(badge.to_badge_model(), orientation)
+        if image_data:
+            badges_cache.set_card(badge.badge_type, orientation, image_data)
+    return image_data
+
+
 async def get_image_data(achievement: Achievement, orientation: str) -> dict:
     image_data = await find_or_generate_image(achievement, orientation)
     if not image_data:
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import sys
+import time
+from typing import Sequence
+
+from loguru import logger
+from sqlalchemy import Row, Select, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlmodel import select
+
+from src.db.models import PointsLedgerEntry, StudentDB
+from src.db.session import async_session_maker
+
+
+def get_drift_query() -> Select:
+    """Студенты, у которых баланс расходится с суммой журнала. Журнал агрегируется один раз по всей таблице"""
+    ledger = (
+        select(PointsLedgerEntry.student_id, func.sum(PointsLedgerEntry.amount).label("balance"))
+        .group_by(PointsLedgerEntry.student_id)
+        .subquery()
+    )
+    ledger_balance = func.coalesce(ledger.c.balance, 0)
+    return (
+        select(StudentDB.id, StudentDB.points, ledger_balance.label("ledger_balance"))
+        .outerjoin(ledger, ledger.c.student_id == StudentDB.id)
+        .where(StudentDB.points != ledger_balance)
+        .order_by(StudentDB.id)
+    )
+
+
+async def find_balance_drift(session: AsyncSession) -> Sequence[Row]:
+    # Один запрос - один снимок: покупки и начисления, идущие параллельно, не дают ложных расхождений
+    return (await session.execute(get_drift_query())).all()
+
+
+async def verify_balances(session_maker: async_sessionmaker = async_session_maker) -> dict:
+    """Пересчитывает балансы всех студентов по журналу и логирует расхождения"""
+    started = time.perf_counter()
+    async with session_maker() as session:
+        drift = await find_balance_drift(session)
+
+    for student_id, points, ledger_balance in drift:
+        logger.warning(
+            f"Points drift for student {student_id}: balance {points}, ledger {ledger_balance} "
+            f"({points - ledger_balance:+d})"
+        )
+
+    results = {"drifted": len(drift), "seconds": round(time.perf_counter() - started, 3)}
+    logger.info(f"Verified points balances in {results['seconds']} s, drifted students: {results['drifted']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка балансов студентов с журналом баллов")
+    parser.parse_args()
+
+    results = asyncio.run(verify_balances())
+    # Ненулевой код возврата - сигнал для планировщика
+    sys.exit(1 if results["drifted"] else 0)
@@ -1,87 +1,158 @@
-from typing import Sequence
+from typing import AsyncIterator, Sequence
 
 from fastapi import HTTPException, status
-from sqlalchemy import Row, func
+from sqlalchemy import Row, Select, func, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import not_, select
 
-from src.db.models import ProductDB, StudentChallenge, StudentDB, StudentProduct
+from src.db.export_window import ExportKey, apply_export_window
+from src.db.models import StudentChallenge, StudentDB, StudentProduct
+from src.db.session import EXPORT_CHUNK_SIZE
 from src.models import Purchase
 
+MAX_BULK_PURCHASES = 1000
 
-async def process_purchase(session: AsyncSession, data: Purchase) -> StudentProduct:
-    async with session.begin():
-        # Получаем продукт
-        query = select(ProductDB).where(ProductDB.id == data.product_id, ProductDB.is_active == True)  # noqa
-        result = await session.execute(query)
-        product = result.scalar_one_or_none()
-        if not product:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": f"Продукт {data.product_id} не существует либо не активен"},
-            )
+# Покупка одним запросом: вставка защищена уникальным (student_id, product_id),
+# списание проходит только при достаточном балансе (блокировка строки студента сериализует покупки)
+# и записывается в журнал баллов тем же запросом
+PURCHASE_STATEMENT = text(
+    """
+    WITH product AS (
+        SELECT value FROM products WHERE id = :product_id AND is_active
+    ),
+    purchase AS (
+        INSERT INTO student_products (student_id, product_id, added_by, created_at)
+        SELECT :student_id, :product_id, :added_by, LOCALTIMESTAMP
+        FROM product
+        WHERE EXISTS (SELECT 1 FROM students WHERE id = :student_id AND points >= product.value)
+        ON CONFLICT (student_id, product_id) DO NOTHING
+        RETURNING id, created_at
+    ),
+    debit AS (
+        UPDATE students SET points = students.points - product.value, updated_at = LOCALTIMESTAMP
+        FROM product, purchase
+        WHERE students.id = :student_id AND students.points >= product.value
+        RETURNING students.points
+    ),
+    ledger AS (
+        INSERT INTO points_ledger (student_id, amount, kind, product_id, created_at)
+        SELECT :student_id, -product.value, 'spend', :product_id, LOCALTIMESTAMP
+        FROM product, debit
+    )
+    SELECT purchase.id, purchase.created_at, debit.points
+    FROM purchase LEFT JOIN debit ON TRUE
+    """
+)
 
-        # Получаем студента
-        query = select(StudentDB).where(StudentDB.id == data.student_id)
-        result = await session.execute(query)
-        student = result.scalar_one_or_none()
-        if not student:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": f"Студент с ID {data.student_id} не найден"},
-            )
+PURCHASE_FAILURE_STATEMENT = text(
+    """
+    SELECT
+        (SELECT value FROM products WHERE id = :product_id AND is_active) AS product_value,
+        (SELECT points FROM students WHERE id = :student_id) AS student_points,
+        EXISTS (
+            SELECT 1 FROM student_products WHERE student_id = :student_id AND product_id = :product_id
+        ) AS already_purchased
+    """
+)
 
-        # Проверяем, не куплен ли уже этот продукт
-        query = select(StudentProduct).where(
-            StudentProduct.student_id == data.student_id, StudentProduct.product_id == data.product_id
+
+async def get_purchase_error(session: AsyncSession, data: Purchase, inserted: bool = False) -> HTTPException:
+    """Определяем причину отказа в покупке (только для неуспешных покупок)"""
+    result = await session.execute(
+        PURCHASE_FAILURE_STATEMENT, {"student_id": data.student_id, "product_id": data.product_id}
+    )
+    product_value, student_points, already_purchased = result.one()
+
+    if product_value is None:
+        message = f"Продукт {data.product_id} не существует либо не активен"
+    elif student_points is None:
+        message = f"Студент с ID {data.student_id} не найден"
+    elif already_purchased and not inserted:
+        message = f"Студент уже приобрел продукт с ID {data.product_id}"
+    else:
+        return HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail={
+                "status": "error",
+                "message": f"Недостаточно бонусов для покупки. Требуется: {product_value}, доступно: {student_points}",
+            },
         )
-        result = await session.execute(query)
-        existing_purchase = result.scalar_one_or_none()
-        if existing_purchase:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"status": "error", "message": f"Студент уже приобрел продукт с ID {data.product_id}"},
-            )
 
-        # Проверяем баланс
-        if student.points < product.value:
-            raise HTTPException(
-                status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                detail={
-                    "status": "error",
-                    "message": f"Недостаточно бонусов для покупки. "
-                    f"Требуется: {product.value}, доступно: {student.points}",
-                },
-            )
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"status": "error", "message": message})
+
 
-        # Создаем запись о покупке
-        new_purchase = StudentProduct(**data.model_dump(exclude={"created_at"}))
-        session.add(new_purchase)
+async def purchase_product(session: AsyncSession, data: Purchase) -> Row:
+    """Покупка в уже открытой транзакции"""
+    params = {
+        "student_id": data.student_id,
+        "product_id": data.product_id,
+        "added_by": data.added_by,
+    }
+    purchase = (await session.execute(PURCHASE_STATEMENT, params)).one_or_none()
 
-        # Обновляем баланс студента
-        student.points -= product.value
+    if purchase is None:
+        raise await get_purchase_error(session, data)
 
-        # Сохраняем изменения
-        await session.flush()
-        return new_purchase
+    # Баланс успел уменьшиться конкурентной покупкой: вставка откатится вместе с транзакцией
+    if purchase.points is None:
+        raise await get_purchase_error(session, data, inserted=True)
 
+    return purchase
+
+
+async def purchase_products(session: AsyncSession, data: list[Purchase]) -> list[dict]:
+    """Покупки в уже открытой транзакции, каждая в своей точке сохранения - ошибка откатывает только её"""
+    results = []
+    for index, item in enumerate(data):
+        try:
+            async with session.begin_nested():
+                purchase = await purchase_product(session, item)
+            results.append(
+                {
+                    "index": index,
+                    "status": "OK",
+                    "status_code": status.HTTP_201_CREATED,
+                    "id": purchase.id,
+                    "created_at": purchase.created_at.isoformat(),
+                }
+            )
+        except HTTPException as e:
+            results.append({"index": index, "status_code": e.status_code, **e.detail})
+    return results
+
+
+def get_adoption_query(since: ExportKey | None = None, until: ExportKey | None = None) -> Select:
+    """Счётчики агрегируются по каждой таблице отдельно и присоединяются к студенту один раз, без размножения строк"""
+    challenges = (
+        select(StudentChallenge.student_id, func.count().label("completed_challenges"))
+        .group_by(StudentChallenge.student_id)
+        .subquery()
+    )
+    products = (
+        select(StudentProduct.student_id, func.count().label("purchased_products"))
+        .group_by(StudentProduct.student_id)
+        .subquery()
+    )
 
-async def get_purchased_products_and_challenges(
-    session: AsyncSession,
-) -> Sequence[Row]:
     query = (
         select(
             StudentDB.id,
             StudentDB.bonuses_last_visited,
-            func.count(func.distinct(StudentChallenge.challenge_id)).label("completed_challenges"),
-            func.count(func.distinct(StudentProduct.product_id)).label("purchased_products"),
+            func.coalesce(challenges.c.completed_challenges, 0).label("completed_challenges"),
+            func.coalesce(products.c.purchased_products, 0).label("purchased_products"),
         )
-        .outerjoin(StudentChallenge)
-        .outerjoin(StudentProduct)
+        .outerjoin(challenges, challenges.c.student_id == StudentDB.id)
+        .outerjoin(products, products.c.student_id == StudentDB.id)
         .where(not_(StudentDB.bonuses_last_visited.is_(None)))
-        .group_by(StudentDB.id, StudentDB.bonuses_last_visited)
-        .order_by(StudentDB.id)
     )
+    return apply_export_window(query, StudentDB.updated_at, StudentDB.id, since, until)
+
 
-    results = await session.execute(query)
-    return results.all()
+async def iter_purchased_products_and_challenges(
+    session: AsyncSession, since: ExportKey | None = None, until: ExportKey | None = None
+) -> AsyncIterator[Sequence[Row]]:
+    """Студенты, заходившие на страницу бонусов. since/until - окно по (updated_at, id) для дельта-выгрузки"""
+    query = get_adoption_query(since, until).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    results = await session.stream(query)
+    async for rows in results.partitions():
+        yield rows
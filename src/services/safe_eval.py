@@ -1,19 +1,159 @@
-from asteval import Interpreter
-from loguru import logger
+import ast
+from functools import lru_cache
+from types import CodeType
 
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.In,
+    ast.NotIn,
+    ast.Is,
+    ast.IsNot,
+    ast.IfExp,
+    ast.Call,
+    ast.Name,
+    ast.Attribute,
+    ast.Subscript,
+    ast.Slice,
+    ast.Load,
+    ast.Constant,
+    ast.Tuple,
+    ast.List,
+)
 
-def safe_eval_condition(condition: str, stats: dict) -> bool:
-    """Safely evaluate condition with student's stats."""
-    aeval = Interpreter(
-        usersyms=stats,
-        use_numpy=False,
-        minimal=True,
-    )
+SAFE_FUNCTIONS = {
+    "abs": abs,
+    "bool": bool,
+    "float": float,
+    "int": int,
+    "len": len,
+    "max": max,
+    "min": min,
+    "round": round,
+    "sum": sum,
+}
+
+# Методы значений статистики, которые можно вызывать в условии: только чтение, без изменения stats
+SAFE_METHODS = {"get", "keys", "values", "items", "count", "index", "startswith", "endswith", "lower", "upper"}
+
+# Пределы как в asteval, которым условия считались раньше: 'x' * 10**9 и 10**10**10 не вычисляются
+MAX_SEQUENCE_LENGTH = 2 << 17
+MAX_EXPONENT = 10_000
+MAX_POWER_BITS = 2 << 17
+
+
+def _safe_mult(left, right):
+    for sequence, times in ((left, right), (right, left)):
+        if (
+            isinstance(sequence, str | bytes | list | tuple)
+            and isinstance(times, int)
+            and len(sequence) * times > MAX_SEQUENCE_LENGTH
+        ):
+            raise ValueError(f"Sequence is too long: more than {MAX_SEQUENCE_LENGTH} items")
+    return left * right
+
+
+def _safe_pow(base, exponent):
+    if isinstance(exponent, int | float) and abs(exponent) > MAX_EXPONENT:
+        raise ValueError(f"Exponent is too large: more than {MAX_EXPONENT}")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * exponent > MAX_POWER_BITS:
+        raise ValueError(f"Power is too large: more than {MAX_POWER_BITS} bits")
+    return base**exponent
+
+
+def _safe_mod(left, right):
+    # Для строк % - форматирование: '%999999999d' % 1 строит строку в гигабайт
+    if not isinstance(left, int | float) or not isinstance(right, int | float):
+        raise ValueError("Modulo is allowed only for numbers")
+    return left % right
+
+
+# Имена с подчёркиванием запрещены в условиях, поэтому не пересекаются со статистикой студента
+GUARDED_OPERATORS = {ast.Mult: "_safe_mult", ast.Pow: "_safe_pow", ast.Mod: "_safe_mod"}
+EVAL_GLOBALS = {
+    "__builtins__": SAFE_FUNCTIONS,
+    "_safe_mult": _safe_mult,
+    "_safe_pow": _safe_pow,
+    "_safe_mod": _safe_mod,
+}
+
+
+class _GuardOperators(ast.NodeTransformer):
+    """Заменяет a * b, a ** b и a % b вызовами функций с проверкой операндов"""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:  # noqa: N802
+        self.generic_visit(node)
+        guard = GUARDED_OPERATORS.get(type(node.op))
+        if guard is None:
+            return node
+        call = ast.Call(func=ast.Name(id=guard, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+def _validate_node(node: ast.AST) -> None:
+    if not isinstance(node, ALLOWED_NODES):
+        raise ValueError(f"Forbidden expression: {type(node).__name__}")
+
+    if isinstance(node, ast.Name) and node.id.startswith("_"):
+        raise ValueError(f"Forbidden name: {node.id}")
+
+    if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+        raise ValueError(f"Forbidden attribute: {node.attr}")
+
+    if isinstance(node, ast.Call) and (node.keywords or not _is_safe_callable(node.func)):
+        raise ValueError(f"Forbidden call: {ast.unparse(node)}")
+
+
+def _is_safe_callable(func: ast.expr) -> bool:
+    if isinstance(func, ast.Name):
+        return func.id in SAFE_FUNCTIONS
+    return isinstance(func, ast.Attribute) and func.attr in SAFE_METHODS
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(condition: str) -> CodeType:
+    """Parse, validate against the whitelist and compile condition once per expression."""
+    try:
+        tree = ast.parse(condition.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid condition syntax: {e.msg}") from e
+
+    for node in ast.walk(tree):
+        _validate_node(node)
+
+    tree = ast.fix_missing_locations(_GuardOperators().visit(tree))
+    return compile(tree, "<condition>", "eval")
+
+
+def run_condition(code: CodeType, stats: dict) -> bool:
+    """Evaluate compiled condition with student's stats."""
     try:
-        result = aeval(condition)
-        logger.info(f"Condition: {condition}, result: {result}")
-        if aeval.error:
-            raise ValueError(f"Error while evaluating condition: {aeval.error}")
-        return bool(result)
+        return bool(eval(code, EVAL_GLOBALS, stats))  # noqa: S307
     except Exception as e:
         raise ValueError(f"Failed to evaluate condition: {str(e)}") from e
+
+
+def safe_eval_condition(condition: str, stats: dict) -> bool:
+    """Safely evaluate condition with student's stats."""
+    return run_condition(compile_condition(condition), stats)
@@ -94,21 +94,10 @@ def get_stats(student: Student) -> dict:
 def get_student_skills(student: Student) -> list:
     """Получаем навыки студента в зависимости от программы и курса"""
     try:
-        skills_data = data_cache.skills_details
-
         student_program = student.statistics.get("program")
         student_lessons_completed = student.statistics.get("lessons_completed")
 
-        skills = []
-        program_skills = skills_data.get(student_program, {})
-
-        for lessons_to_complete in program_skills:
-            if student_lessons_completed >= lessons_to_complete:
-                skills.append(program_skills[lessons_to_complete])
-            else:
-                break
-
-        return skills
+        return data_cache.snapshot.get_skills(student_program, student_lessons_completed)
     except Exception as e:
         logger.error(f"Error getting skills: {e}")
         return []
@@ -126,9 +115,23 @@ async def get_achievements_data(data: Sequence[Row]) -> list:
 
 def get_meme_stats(meme_stats: dict) -> dict:
     if meme_stats:
-        answer_to_question = {meme.id: meme.question for meme in data_cache.meme_data.values()}
+        answer_to_question = data_cache.snapshot.meme_questions
 
         for key, answer in meme_stats.items():
             if answer_to_question.get(key) is not None:
                 meme_stats[key] = {"question": answer_to_question[key], "answer": answer}
     return meme_stats
+
+
+def get_progression(history: Sequence[Row]) -> dict:
+    """Ряды значений по каждому ключу статистики и смены достижений. Дельты уже содержат только изменения"""
+    stats = {}
+    achievements_history = []
+    for created_at, stats_delta, achievement_id, title, picture in history:
+        for key, value in (stats_delta or {}).items():
+            stats.setdefault(key, []).append([created_at.isoformat(), value])
+        if achievement_id is not None:
+            achievements_history.append(
+                {"created_at": created_at.isoformat(), "title": title, "image_url": f"images/logo_{picture}"}
+            )
+    return {"stats": stats, "achievements": achievements_history}
@@ -6,7 +6,7 @@ from loguru import logger
 
 from src.config import IS_HEROKU
 from src.db.badges_crud import BadgeDBHandler, get_badges_crud
-from src.services.images import find_or_generate_image
+from src.services.images import get_badge_card
 from src.web.utils import add_no_cache_headers, get_orientation, is_social_bot
 
 router = APIRouter()
@@ -59,7 +59,10 @@ async def vk_badge(
 ):
     orientation = get_orientation(request)
     badge = await badges_crud.get_badge_by_id(badge_id)
-    image_data = await find_or_generate_image(badge.to_badge_model(), orientation)
+    if not badge:
+        raise HTTPException(status_code=404, detail="Badge not found")
+
+    image_data = await get_badge_card(badge, orientation)
 
     if is_social_bot(request):
         return templates.TemplateResponse(
@@ -1,20 +1,27 @@
 import json
+from datetime import datetime
 
 import aiohttp
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse, RedirectResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from loguru import logger
 
 from src.bot.logger import tg_logger
 from src.config import IS_HEROKU, settings
 from src.db.students_crud import StudentDBHandler, get_student_crud
-from src.dependencies import data_cache, sheet_pusher
+from src.dependencies import data_cache, leaderboard_cache, quiz_cache, sheet_pusher
 from src.models import CRMSubmission, URLSubmission
 from src.services.images import fetch_image, get_achievement_logo_relative_path, get_image_data
 from src.services.security import verify_hash_dependency
-from src.services.stats import get_achievements_data, get_meme_stats, get_stats, get_student_skills
+from src.services.stats import (
+    get_achievements_data,
+    get_meme_stats,
+    get_progression,
+    get_stats,
+    get_student_skills,
+)
 from src.services.student_service import (
     NoDataException,
     get_achievement_for_student,
@@ -49,7 +56,7 @@ async def stats(
         db_achievement = await update_or_create_achievement_in_db(crud, handler.achievement)
         await crud.add_achievement_to_student(db_student.id, db_achievement.id)
 
-        meme_stats = get_meme_stats(json.loads(db_student.meme_stats))
+        meme_stats = get_meme_stats(dict(db_student.meme_stats))
 
         context = {
             "request": request,
@@ -82,6 +89,20 @@ async def stats(
         raise HTTPException(status_code=500, detail="Internal server error") from e
 
 
+@router.get("/stats/{student_id}/progression", name="stats_progression")
+async def stats_progression(
+    student_id: int,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    hash_verified: None = Depends(verify_hash_dependency),
+    crud: StudentDBHandler = Depends(get_student_crud),
+):
+    """Динамика статистики и достижений студента для графиков на странице статистики.
+    achievements - смены текущего достижения: повторное получение того же достижения подряд не записывается"""
+    history = await crud.get_student_history(student_id, since, until)
+    return add_no_cache_headers(JSONResponse({"student_id": student_id, **get_progression(history)}))
+
+
 @router.get("/get_image/{student_id}", name="get_image")
 async def get_image(
     request: Request,
@@ -250,9 +271,19 @@ async def submit_to_crm(data: CRMSubmission, background_tasks: BackgroundTasks):
 
 @router.get("/results", name="results")
 async def top_achievements(request: Request, crud: StudentDBHandler = Depends(get_student_crud)):
-    counts_of_received_achievements = await crud.get_list_of_achievements_received()
-    achievements = await get_achievements_data(counts_of_received_achievements)
-    return templates.TemplateResponse("results.html", {"request": request, "achievements": achievements})
+    async def load_achievements() -> list[dict]:
+        return await get_achievements_data(await crud.get_list_of_achievements_received())
+
+    achievements = await leaderboard_cache.get(load_achievements)
+
+    # Страница зависит только от рейтинга и адреса сайта (url_for)
+    page_key = str(request.base_url)
+    if page := leaderboard_cache.get_page(page_key):
+        return HTMLResponse(page)
+
+    response = templates.TemplateResponse("results.html", {"request": request, "achievements": achievements})
+    leaderboard_cache.set_page(page_key, response.body)
+    return response
 
 
 @router.get("/dashboard", name="dashboard")
@@ -270,10 +301,19 @@ async def meme_quiz(
     request: Request,
     student_id: int,
 ):
+    # Вопросы рендерятся один раз на версию листа memes, на каждый запрос - только обёртка страницы
+    snapshot = data_cache.snapshot
+    version = snapshot.sheet_version("memes")
+    questions = quiz_cache.get(version)
+    if questions is None:
+        template = templates.get_template("meme_quiz_questions.html")
+        questions = template.render(questions=snapshot.meme_data.values())
+        quiz_cache.set(version, questions)
+
     context = {
         "request": request,
         "student_id": student_id,
-        "questions": data_cache.meme_data.values(),
+        "questions_html": questions,
     }
     return templates.TemplateResponse("meme-quiz.html", context)
 
@@ -287,9 +327,10 @@ async def meme_quiz_result(
         answers = await request.json()
         student_id = int(answers.pop("student_id"))
 
+        meme_data = data_cache.meme_data
         meme_stats = {}
         for meme_id, option_index in answers.items():
-            meme_stats[meme_id] = data_cache.meme_data[meme_id].options[option_index]
+            meme_stats[meme_id] = meme_data[meme_id].options[option_index]
 
         result = await crud.add_meme_stats_to_student(student_id, meme_stats)
 
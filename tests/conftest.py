@@ -0,0 +1,37 @@
+import os
+import re
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.db.json_codecs import json_deserializer, json_serializer
+
+# Тесты очищают таблицы, поэтому идут только на отдельной базе с применёнными миграциями (alembic upgrade head)
+TEST_DATABASE_URL = re.sub(r"^postgres(ql)?:", "postgresql+asyncpg:", os.getenv("TEST_DATABASE_URL", ""))
+
+TRUNCATE_STATEMENT = text(
+    "TRUNCATE students, products, challenges, achievements, badges, idempotency_keys, "
+    "achievement_rollups, challenge_rollups RESTART IDENTITY CASCADE"
+)
+
+
+@pytest_asyncio.fixture
+async def session_maker():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    # Без пула: каждый тест идёт в своём event loop, соединения между ними не переиспользуются
+    engine = create_async_engine(
+        TEST_DATABASE_URL, poolclass=NullPool, json_serializer=json_serializer, json_deserializer=json_deserializer
+    )
+    async with engine.begin() as connection:
+        await connection.execute(TRUNCATE_STATEMENT)
+
+    yield async_sessionmaker(engine, expire_on_commit=False)
+
+    async with engine.begin() as connection:
+        await connection.execute(TRUNCATE_STATEMENT)
+    await engine.dispose()
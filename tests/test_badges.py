@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from fastapi.requests import Request
+from sqlalchemy import text
+
+from src.db.badges_crud import BadgeDBHandler
+from src.services.badges_ingest import BadgeBodyError, iter_badges
+
+
+def make_badge(id_: int, **fields) -> dict:
+    badge = {
+        "id": id_,
+        "badge_type": "top",
+        "student_id": id_,
+        "student_name": f"Student {id_}",
+        "title": "Top",
+        "description": "",
+    }
+    return {**badge, **fields}
+
+
+def make_request(badges: list[dict]) -> Request:
+    body = "".join(f"{json.dumps(badge)}\n" for badge in badges).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", b"application/x-ndjson")]}
+    return Request(scope, receive)
+
+
+async def get_badges_state(session) -> tuple[int, list[int]]:
+    oid = (await session.execute(text("SELECT 'badges'::regclass::oid"))).scalar_one()
+    ids = (await session.execute(text("SELECT id FROM badges ORDER BY id"))).scalars().all()
+    return oid, ids
+
+
+@pytest.mark.asyncio
+async def test_invalid_badge_keeps_previous_table(session_maker):
+    async with session_maker() as session:
+        results = await BadgeDBHandler(session).process_badges_batch(
+            iter_badges(make_request([make_badge(1), make_badge(2)]))
+        )
+        assert results["rows"] == 2
+        previous = await get_badges_state(session)
+        await session.commit()
+
+    # Вторая строка невалидна: загрузка прерывается, старая таблица не подменяется
+    async with session_maker() as session:
+        request = make_request([make_badge(3), make_badge(4, student_id="unknown")])
+        with pytest.raises(BadgeBodyError, match="Invalid badge 1"):
+            await BadgeDBHandler(session).process_badges_batch(iter_badges(request))
+
+    async with session_maker() as session:
+        assert await get_badges_state(session) == previous
+        assert previous[1] == [1, 2]
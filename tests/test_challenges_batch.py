@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+from sqlmodel import select
+
+from src.db.challenges_crud import ChallengeDBHandler
+from src.db.models import StudentChallenge, StudentDB
+from src.models import Challenge, ProfessionEnum, ProfessionEnumWithAll
+
+
+def make_challenge(id_: str, is_active: bool = True) -> Challenge:
+    return Challenge(
+        id=id_,
+        title=f"Challenge {id_}",
+        profession=ProfessionEnumWithAll.ALL,
+        eval="lessons > 5",
+        value=10,
+        is_active=is_active,
+    )
+
+
+@pytest.mark.asyncio
+async def test_activated_challenges_scored_for_all_students(session_maker):
+    async with session_maker() as session:
+        session.add_all(
+            StudentDB(id=i, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1), statistics={"lessons": i})
+            for i in range(1, 11)
+        )
+        await session.commit()
+
+        crud = ChallengeDBHandler(session)
+        results = await crud.process_challenges_batch([make_challenge("new"), make_challenge("off", is_active=False)])
+        assert results["created"] == 2
+        assert results["completed"] == 5
+
+        # Уже активный челлендж не пересчитывается, включённый - пересчитывается
+        results = await crud.process_challenges_batch([make_challenge("new"), make_challenge("off")])
+        assert results["completed"] == 5
+
+        completions = await session.execute(select(StudentChallenge.challenge_id, StudentChallenge.student_id))
+        assert sorted(completions.all()) == [(id_, i) for id_ in ("new", "off") for i in range(6, 11)]
+
+        student = await session.get(StudentDB, 10, populate_existing=True)
+        assert student.points == 20
@@ -0,0 +1,30 @@
+import pytest
+
+from src.models import ProfessionEnum
+from src.services.challenges_scoring import CompiledChallenge, evaluate_chunk
+from src.services.condition_masks import StatsColumns, compile_mask
+from src.services.safe_eval import compile_condition
+
+# Произведения больше 2**53 в float64 округляются: a * b - c * d == 1 для последней строки NumPy посчитал бы как 0
+STATS = [
+    {"a": 3, "b": 4, "c": 11, "d": 1},
+    {"a": 2**26, "b": 2**26, "c": 1, "d": 1},
+    {"a": 2**27 + 1, "b": 2**27 + 1, "c": 2**26, "d": 2**28 + 4},
+]
+
+
+@pytest.mark.parametrize("condition", ["a * b - c * d == 1", "a * b > c", "-(a * b) < -(c * d)", "a * b * c"])
+def test_mask_matches_row_wise_evaluation(condition):
+    code = compile_condition(condition)
+    rows = [(i, ProfessionEnum.PD, stats) for i, stats in enumerate(STATS)]
+
+    completions = {}
+    for mask in (compile_mask(condition), None):
+        challenge = CompiledChallenge("c", "ALL", 10, code, mask)
+        completions[mask is None] = evaluate_chunk(rows, [challenge], set())
+    assert completions[False] == completions[True]
+
+
+def test_out_of_range_intermediate_not_computed():
+    _, valid = StatsColumns(STATS).evaluate(compile_mask("a * b - c * d == 1"))
+    assert valid.tolist() == [True, True, False]
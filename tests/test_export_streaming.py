@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.db.session import EXPORT_CHUNK_SIZE
+from src.models import ExportFormat
+from src.services.export_csv import EXPORT_GENERATORS
+
+ROWS_COUNT = 1_000_000
+# gzip копит сжатые данные и отдаёт их не после каждой пачки
+MAX_PARTITIONS_IN_FLIGHT = 2
+MAX_CHUNK_SIZE = 2**20
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("export_format", list(ExportFormat))
+async def test_export_streams_partitions(export_format):
+    pulled = 0
+
+    async def partitions():
+        nonlocal pulled
+        created_at = datetime(2024, 1, 1)
+        for offset in range(0, ROWS_COUNT, EXPORT_CHUNK_SIZE):
+            pulled += 1
+            yield [
+                (student_id, f"product_{student_id % 25}", created_at + timedelta(seconds=student_id), "admin")
+                for student_id in range(offset, offset + EXPORT_CHUNK_SIZE)
+            ]
+
+    # Генератор не читает курсор наперёд: между отданными кусками берёт не больше пары пачек,
+    # поэтому память выгрузки не зависит от числа строк
+    pulled_at_last_chunk = 0
+    async for chunk in EXPORT_GENERATORS[export_format](partitions(), "purchases"):
+        assert pulled - pulled_at_last_chunk <= MAX_PARTITIONS_IN_FLIGHT
+        assert len(chunk) <= MAX_CHUNK_SIZE
+        pulled_at_last_chunk = pulled
+
+    assert pulled == ROWS_COUNT // EXPORT_CHUNK_SIZE
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import Select, text
+from sqlalchemy.dialects import postgresql
+
+from src.db.export_window import ExportKey, get_export_until
+from src.db.models import ProductDB, StudentDB, StudentProduct
+from src.db.products_crud import ProductDBHandler
+from src.db.students_crud import get_last_login_query
+from src.models import DateQuery, ProfessionEnum
+from src.services.purchases import get_adoption_query
+
+# 20 000 студентов с входами раз в 5 минут, на страницу бонусов заходил каждый сотый
+SEED_STUDENTS_STATEMENT = text(
+    """
+    INSERT INTO students (id, profession, started_at, statistics, meme_stats, points, last_login, bonuses_last_visited)
+    SELECT
+        i, 'PD', '2024-01-01', '{}'::jsonb, '{}'::jsonb, 0,
+        TIMESTAMP '2024-01-01' + i * INTERVAL '5 minutes',
+        CASE WHEN i % 100 = 0 THEN TIMESTAMP '2024-01-01' + i * INTERVAL '5 minutes' END
+    FROM generate_series(1, 20000) AS i
+    """
+)
+
+
+async def get_plan(session, query: Select) -> str:
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    return "\n".join((await session.execute(text(f"EXPLAIN {sql}"))).scalars().all())
+
+
+def test_date_query_range():
+    assert DateQuery(date=date(2024, 1, 10)).last_date == date(2024, 1, 10)
+    assert not DateQuery(date=date(2024, 1, 10), end_date=date(2024, 1, 12)).is_reversed
+    assert DateQuery(date=date(2024, 1, 10), end_date=date(2024, 1, 9)).is_reversed
+
+
+@pytest.mark.asyncio
+async def test_exports_use_visit_date_indexes(session_maker):
+    async with session_maker() as session:
+        await session.execute(SEED_STUDENTS_STATEMENT)
+        await session.execute(text("ANALYZE students"))
+        await session.commit()
+
+        assert "ix_students_last_login" in await get_plan(
+            session, get_last_login_query(date(2024, 1, 10), date(2024, 1, 11))
+        )
+        assert "ix_students_bonuses_last_visited" in await get_plan(session, get_adoption_query())
+
+
+@pytest.mark.asyncio
+async def test_export_window_keyset(session_maker):
+    purchased_at = datetime(2024, 1, 10, 12)
+    watermark = purchased_at + timedelta(minutes=1)
+
+    async def export(since: ExportKey | None, until: ExportKey) -> list[str]:
+        partitions = ProductDBHandler(session).iter_all_purchased_products(since, until)
+        return [row.product_id async for rows in partitions for row in rows]
+
+    async with session_maker() as session:
+        session.add(StudentDB(id=1, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1)))
+        session.add_all(ProductDB(id=f"product_{i}", title=f"Product {i}", value=1, is_active=True) for i in range(5))
+        # Три покупки с одинаковым временем и одна после отметки
+        session.add_all(
+            StudentProduct(id=i, student_id=1, product_id=f"product_{i}", added_by="test", created_at=purchased_at)
+            for i in range(1, 4)
+        )
+        session.add(StudentProduct(id=4, student_id=1, product_id="product_4", added_by="test", created_at=watermark))
+        await session.commit()
+
+        def get_until(since: ExportKey | None = None):
+            return get_export_until(session, StudentProduct.created_at, StudentProduct.id, watermark, since)
+
+        # Полная выгрузка тоже закрывается отметкой
+        until = await get_until()
+        assert until == ExportKey(purchased_at, 3)
+        assert await export(None, until) == ["product_1", "product_2", "product_3"]
+
+        # Покупка с тем же временем, зафиксированная позже, попадает в следующую дельту
+        session.add(
+            StudentProduct(id=5, student_id=1, product_id="product_0", added_by="test", created_at=purchased_at)
+        )
+        await session.commit()
+
+        next_until = await get_until(until)
+        assert next_until == ExportKey(purchased_at, 5)
+        assert await export(until, next_until) == ["product_0"]
+
+        # Новых строк нет - окно пустое, курсор не сдвигается
+        assert await get_until(next_until) == next_until
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from fastapi import status
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
+from sqlmodel import select
+
+from src.db.models import IdempotencyKeyDB, ProductDB, StudentDB, StudentProduct
+from src.models import ProfessionEnum, Purchase
+from src.services.idempotency import get_request_hash, run_idempotent
+from src.services.purchases import purchase_products
+
+PURCHASES = [Purchase(student_id=1, product_id=f"product_{i}", added_by="test") for i in range(3)]
+
+
+async def purchase(session_maker, key: str, data: list[Purchase]) -> JSONResponse:
+    """То же, что POST /bonuses/purchases/bulk: покупки и сохранение ответа в одной транзакции"""
+    async with session_maker() as session:
+
+        async def get_response() -> JSONResponse:
+            results = await purchase_products(session, data)
+            return JSONResponse({"results": results}, status_code=status.HTTP_200_OK)
+
+        request_hash = get_request_hash([item.model_dump(exclude={"created_at"}) for item in data])
+        return await run_idempotent(session, key, request_hash, get_response)
+
+
+@pytest_asyncio.fixture
+async def student(session_maker):
+    async with session_maker() as session:
+        session.add(StudentDB(id=1, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1), points=1000))
+        session.add_all(ProductDB(id=f"product_{i}", title=f"Product {i}", value=100, is_active=True) for i in range(3))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("student")
+async def test_parallel_requests_with_same_key_purchase_once(session_maker):
+    responses = await asyncio.gather(*(purchase(session_maker, "key-1", PURCHASES) for _ in range(5)))
+
+    assert {response.body for response in responses} == {responses[0].body}
+    assert sum(response.headers.get("Idempotent-Replayed") == "true" for response in responses) == 4
+
+    async with session_maker() as session:
+        points = (await session.execute(select(StudentDB.points).where(StudentDB.id == 1))).scalar_one()
+        purchases = (await session.execute(select(func.count()).select_from(StudentProduct))).scalar_one()
+        saved = (await session.execute(select(IdempotencyKeyDB))).scalar_one()
+
+    assert points == 700
+    assert purchases == 3
+    assert saved.response == responses[0].body.decode()
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("student")
+async def test_key_reused_for_another_request_is_rejected(session_maker):
+    await purchase(session_maker, "key-1", PURCHASES[:1])
+    response = await purchase(session_maker, "key-1", PURCHASES[1:])
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import func
+from sqlmodel import select
+
+from src.db.challenges_crud import ChallengeDBHandler
+from src.db.models import ChallengesDB, PointsLedgerEntry, StudentDB
+from src.models import ProfessionEnum, ProfessionEnumWithAll
+from src.services.challenges_scoring import save_completions
+from src.services.points_ledger import find_balance_drift
+
+
+@pytest.mark.asyncio
+async def test_earned_points_match_ledger(session_maker):
+    async with session_maker() as session:
+        session.add_all(
+            StudentDB(id=i, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1), statistics={"lessons": 10})
+            for i in (1, 2)
+        )
+        session.add_all(
+            ChallengesDB(
+                id=f"c{value}",
+                title=f"Challenge {value}",
+                profession=ProfessionEnumWithAll.ALL,
+                eval="lessons > 5",
+                value=value,
+                is_active=True,
+            )
+            for value in (10, 20, 40)
+        )
+        await session.commit()
+
+        # Повторное выполнение того же челленджа не начисляет баллы второй раз
+        completions = [{"student_id": 1, "challenge_id": "c10"}, {"student_id": 1, "challenge_id": "c20"}]
+        assert await save_completions(session, completions, {"c10": 10, "c20": 20}) == 2
+        assert await save_completions(session, completions[:1], {"c10": 10}) == 0
+
+        student = await session.get(StudentDB, 2)
+        _, completed = await ChallengeDBHandler(session).update_student_challenges(student, [])
+        assert {challenge.id for challenge in completed} == {"c10", "c20", "c40"}
+
+        balances = await session.execute(select(StudentDB.id, StudentDB.points).order_by(StudentDB.id))
+        assert balances.all() == [(1, 30), (2, 70)]
+        assert await session.scalar(select(func.count()).select_from(PointsLedgerEntry)) == 5
+        assert await find_balance_drift(session) == []
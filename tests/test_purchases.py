@@ -0,0 +1,49 @@
+import asyncio
+from datetime import date
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlmodel import select
+
+from src.db.models import PointsLedgerEntry, ProductDB, StudentDB, StudentProduct
+from src.models import ProfessionEnum, Purchase
+from src.services.purchases import purchase_product
+
+PARALLEL_PURCHASES = 10
+PRODUCT_VALUE = 100
+
+
+@pytest.mark.asyncio
+async def test_parallel_purchases_do_not_overdraw_balance(session_maker):
+    async with session_maker() as session:
+        session.add(StudentDB(id=1, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1), points=PRODUCT_VALUE))
+        session.add_all(
+            ProductDB(id=f"product_{i}", title=f"Product {i}", value=PRODUCT_VALUE, is_active=True)
+            for i in range(PARALLEL_PURCHASES)
+        )
+        await session.commit()
+
+    async def buy(product_id: str) -> int:
+        async with session_maker() as session:
+            try:
+                async with session.begin():
+                    await purchase_product(session, Purchase(student_id=1, product_id=product_id, added_by="test"))
+            except HTTPException as e:
+                return e.status_code
+            return status.HTTP_201_CREATED
+
+    # Каждая покупка в своём соединении: баланса хватает только на одну из них
+    codes = await asyncio.gather(*(buy(f"product_{i}") for i in range(PARALLEL_PURCHASES)))
+
+    assert codes.count(status.HTTP_201_CREATED) == 1
+    assert codes.count(status.HTTP_402_PAYMENT_REQUIRED) == PARALLEL_PURCHASES - 1
+
+    async with session_maker() as session:
+        points = (await session.execute(select(StudentDB.points).where(StudentDB.id == 1))).scalar_one()
+        purchases = (await session.execute(select(func.count()).select_from(StudentProduct))).scalar_one()
+        ledger = (await session.execute(select(func.sum(PointsLedgerEntry.amount)))).scalar_one()
+
+    assert points == 0
+    assert purchases == 1
+    assert ledger == -PRODUCT_VALUE
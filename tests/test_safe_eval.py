@@ -0,0 +1,21 @@
+import pytest
+
+from src.services.safe_eval import safe_eval_condition
+
+
+@pytest.mark.parametrize(
+    ("condition", "error"),
+    [
+        ("'%999999999d' % lessons > ''", "Modulo is allowed only for numbers"),
+        ("'x' * 10**9 > ''", "Sequence is too long"),
+        ("lessons ** 10**10 > 0", "Exponent is too large"),
+        ("__import__('os')", "Forbidden call"),
+    ],
+)
+def test_oversized_or_forbidden_conditions_rejected(condition, error):
+    with pytest.raises(ValueError, match=error):
+        safe_eval_condition(condition, {"lessons": 1})
+
+
+def test_numeric_modulo_allowed():
+    assert safe_eval_condition("lessons % 5 == 2 and 7.5 % 2 == 1.5", {"lessons": 12})
@@ -0,0 +1,79 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from src.db.models import AchievementDB, StudentDB, StudentHistory
+from src.db.students_crud import StudentDBHandler, get_current_achievement_query
+from src.models import AchievementType, ProfessionEnum, Student
+
+# Много записей статистики и редкие смены достижения у каждого студента
+SEED_HISTORY_STATEMENT = text(
+    """
+    INSERT INTO student_history (student_id, created_at, stats_delta, achievement_id)
+    SELECT
+        1 + i % 100,
+        TIMESTAMP '2024-01-01' + i * INTERVAL '1 minute',
+        CASE WHEN i % 50 <> 0 THEN jsonb_build_object('lessons', i) END,
+        CASE WHEN i % 50 = 0 THEN 1 + i % 2 END
+    FROM generate_series(1, 20000) AS i
+    """
+)
+
+
+@pytest.mark.asyncio
+async def test_new_student_gets_stats_snapshot(session_maker):
+    async with session_maker() as session:
+        # Без проверки полного набора ключей статистики: для истории важен только снимок
+        student = Student.model_construct(
+            id=1, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1), statistics={"lessons": 3}
+        )
+        assert await StudentDBHandler(session).create_student(student) is not None
+
+        snapshots = await session.execute(select(StudentHistory.stats_delta).where(StudentHistory.student_id == 1))
+        assert snapshots.scalars().all() == [{"lessons": 3}]
+
+
+@pytest.mark.asyncio
+async def test_history_stores_achievement_changes(session_maker):
+    async with session_maker() as session:
+        session.add_all(
+            StudentDB(id=i, profession=ProfessionEnum.PD, started_at=date(2024, 1, 1)) for i in range(1, 101)
+        )
+        session.add_all(
+            AchievementDB(
+                id=i,
+                title=f"Achievement {i}",
+                type=AchievementType.NEWBIE,
+                description="",
+                profession="PD",
+                picture=f"{i}.png",
+            )
+            for i in (1, 2)
+        )
+        await session.commit()
+
+        crud = StudentDBHandler(session)
+        for achievement_id in (1, 1, 2, 2, 1):
+            await crud.add_achievement_to_student(1, achievement_id)
+
+        # Повторные получения того же достижения подряд не записываются
+        changes = await session.execute(
+            select(StudentHistory.achievement_id).where(StudentHistory.student_id == 1).order_by(StudentHistory.id)
+        )
+        assert changes.scalars().all() == [1, 2, 1]
+        assert (await crud.get_achievement_by_student_id(1)).id == 1
+
+        await session.execute(SEED_HISTORY_STATEMENT)
+        await session.execute(text("ANALYZE student_history"))
+        await session.commit()
+
+        # Последняя смена достижения - первая запись частичного индекса, без сортировки
+        sql = get_current_achievement_query(2).compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        plan = "\n".join((await session.execute(text(f"EXPLAIN {sql}"))).scalars().all())
+        assert "Index Scan using ix_student_history_achievements" in plan
+        assert "Sort" not in plan